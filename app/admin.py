@@ -1,3 +1,110 @@
-# from django.contrib import admin
+from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.http import HttpResponseRedirect
+from django.utils import timezone
 
-# Register your models here.
+from .models import Transaction, Transfer, User, Wallet
+from .pagination import EstimatedCountPaginator
+
+# Query parameter that opts out of the default month ("?dates=all").
+ALL_DATES_VAR = "dates"
+
+
+class LargeTableChangeList(ChangeList):
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(ALL_DATES_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        query = super().get_query_string(new_params, remove)
+        # A link that drops every parameter ("All dates", "Clear all
+        # filters") would land on the default month again.
+        if self.date_hierarchy and query == "?":
+            return f"?{ALL_DATES_VAR}=all"
+        return query
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables too big to count or scan: estimated
+    counts, no "N total" query and newest rows first by primary key.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    ordering = ["-id"]
+
+    def get_changelist(self, request, **kwargs):
+        return LargeTableChangeList
+
+    def changelist_view(self, request, extra_context=None):
+        # Without a drill-down the date hierarchy lists every year with a
+        # DISTINCT over the whole table; the bare changelist starts on the
+        # current month instead. Searches, filters, popups and ?dates=all
+        # are left alone.
+        field = self.date_hierarchy
+        if field and not request.GET:
+            today = timezone.localdate()
+            query = request.GET.copy()
+            query[f"{field}__year"] = str(today.year)
+            query[f"{field}__month"] = str(today.month)
+            return HttpResponseRedirect(f"{request.path}?{query.urlencode()}")
+        return super().changelist_view(request, extra_context)
+
+
+class ReadOnlyAdmin(LargeTableAdmin):
+    """Ledger rows only change through the wallet operations."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin, LargeTableAdmin):
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ("Wallet", {"fields": ("cpf", "limit_tier")}),
+    )
+    add_fieldsets = BaseUserAdmin.add_fieldsets + (
+        (None, {"fields": ("email", "cpf")}),
+    )
+    list_display = ["email", "username", "cpf", "limit_tier", "is_staff"]
+    list_select_related = ["limit_tier"]
+    list_filter = ["limit_tier"]
+    # Exact matches use the unique indexes; icontains would scan the table.
+    search_fields = ["=email", "=cpf", "=username"]
+    ordering = ["-id"]
+
+
+@admin.register(Wallet)
+class WalletAdmin(LargeTableAdmin):
+    list_display = ["id", "user", "balance", "held_balance", "updated_at"]
+    list_select_related = ["user"]
+    raw_id_fields = ["user"]
+    search_fields = ["=user__email", "=user__cpf"]
+    # Balances only move through deposits, transfers and holds.
+    readonly_fields = ["balance", "held_balance", "created_at", "updated_at"]
+
+
+@admin.register(Transaction)
+class TransactionAdmin(ReadOnlyAdmin):
+    list_display = ["id", "wallet", "transaction_type", "amount", "created_at"]
+    list_select_related = ["wallet__user"]
+    raw_id_fields = ["wallet", "transfer", "counterparty"]
+    date_hierarchy = "created_at"
+
+
+@admin.register(Transfer)
+class TransferAdmin(ReadOnlyAdmin):
+    list_display = ["id", "sender", "receiver", "amount", "created_at"]
+    list_select_related = ["sender__user", "receiver__user"]
+    raw_id_fields = ["sender", "receiver"]
+    date_hierarchy = "created_at"
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .models import User, Wallet
+
+
+class AliasCache:
+    """
+    Bounded LRU map of user aliases (``("email", value)`` or ``("cpf", value)``)
+    to ``(user_id, wallet_id)``. Entries of a user are dropped when that user
+    is saved or deleted in this process (see app.signals); the TTL bounds how
+    long other processes can hold a stale entry.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.keys_by_user = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            user_id, wallet_id, expires = entry
+            if expires <= time.monotonic():
+                self._discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return user_id, wallet_id
+
+    def set(self, key, user_id, wallet_id):
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (user_id, wallet_id, time.monotonic() + self.ttl)
+            self.keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self.entries) > self.max_size:
+                self._discard(next(iter(self.entries)))
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.keys_by_user.get(entry[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.keys_by_user[entry[0]]
+
+
+_cache = None
+
+
+def get_alias_cache():
+    global _cache
+    if _cache is None:
+        config = settings.WALLET_ALIAS_CACHE
+        _cache = AliasCache(config["MAX_SIZE"], config["TTL"])
+    return _cache
+
+
+def resolve_wallet(alias, value):
+    """
+    The wallet (with its user) of the user whose ``alias`` field equals
+    ``value``, or None. A cache hit costs one query; the owner's alias is
+    checked on the fetched row, so a stale entry is never trusted.
+    """
+    cache = get_alias_cache()
+    key = (alias, value)
+    cached = cache.get(key)
+    if cached is not None:
+        user_id, wallet_id = cached
+        wallet = (
+            Wallet.objects.for_wallet(wallet_id)
+            .select_related("user")
+            .filter(user_id=user_id, **{f"user__{alias}": value})
+            .first()
+        )
+        if wallet is not None:
+            return wallet
+        cache.invalidate_user(user_id)
+
+    # Served by the unique indexes on User.email and User.cpf.
+    user_id = User.objects.filter(**{alias: value}).values_list("pk", flat=True).first()
+    if user_id is None:
+        return None
+    wallet = Wallet.objects.for_user(user_id).select_related("user").first()
+    if wallet is not None:
+        cache.set(key, user_id, wallet.pk)
+    return wallet
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, broker, channel, maxsize):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event):
+        # A slow client only needs the latest state, so the oldest event is dropped.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InMemoryBroker:
+    """
+    Fans events out to the subscribers of this process. Publishing is thread
+    safe, so sync views and ORM code can publish to async subscribers.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, str(channel), self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(subscription.channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscribers.pop(subscription.channel, None)
+
+    def publish(self, channel, event):
+        self.dispatch(str(channel), event)
+
+    def dispatch(self, channel, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:  # the subscriber's event loop is closed
+                self.unsubscribe(subscription)
+
+
+class PostgresNotifyBroker(InMemoryBroker):
+    """
+    Cross-process fan-out over PostgreSQL LISTEN/NOTIFY. Each process runs one
+    listener thread with its own connection and hands notifications to its
+    local subscribers.
+    """
+
+    pg_channel = "wallet_events"
+
+    def __init__(self, queue_size=100, using="default"):
+        super().__init__(queue_size)
+        self.using = using
+        self.listener = None
+
+    def subscribe(self, channel):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return super().subscribe(channel)
+
+    def publish(self, channel, event):
+        payload = json.dumps({"channel": str(channel), "event": event})
+        with connections[self.using].cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [self.pg_channel, payload])
+
+    def listen(self):
+        import psycopg2
+
+        params = connections[self.using].get_connection_params()
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**params)
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.pg_channel}")
+                while True:
+                    select.select([conn], [], [], 30)
+                    conn.poll()
+                    while conn.notifies:
+                        message = json.loads(conn.notifies.pop(0).payload)
+                        self.dispatch(message["channel"], message["event"])
+            except Exception:
+                logger.exception("Wallet event listener failed, reconnecting")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_brokers = {}
+
+
+def get_broker():
+    path = settings.WALLET_EVENTS["BROKER"]
+    if path not in _brokers:
+        _brokers[path] = import_string(path)()
+    return _brokers[path]
+
+
+def transaction_payload(entry, balance):
+    """A ledger row and the wallet balance right after it, as JSON-ready data."""
+    return {
+        "wallet_id": entry.wallet_id,
+        "balance": _decimal(balance),
+        "transaction": {
+            "id": entry.pk,
+            "amount": _decimal(entry.amount),
+            "transaction_type": entry.transaction_type,
+            "created_at": entry.created_at.isoformat().replace("+00:00", "Z"),
+        },
+    }
+
+
+def publish_transaction(entry, balance):
+    """
+    Publishes a ledger row and the wallet balance right after it. Meant to run
+    from ``transaction.on_commit`` so only committed changes are pushed; a
+    broker failure is logged instead of raised, since the money has already
+    moved and later commit callbacks must still run.
+    """
+    try:
+        get_broker().publish(
+            entry.wallet_id,
+            {"event": "transaction", **transaction_payload(entry, balance)},
+        )
+    except Exception:
+        logger.exception("Failed to publish transaction %s", entry.pk)
+
+
+def _decimal(value):
+    return "{:f}".format(Decimal(value).quantize(Decimal("0.01")))
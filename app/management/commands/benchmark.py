@@ -0,0 +1,282 @@
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from app.models import Transaction, Transfer, User, Wallet
+from app.renderers import ORJSONRenderer
+from app.serializers import TransactionSerializer, transaction_rows
+from app.sharding import shard_for_user
+
+
+def run_transfers(wallet_ids, transfers, cross_shard):
+    """One benchmark worker: random transfers, mostly within a shard."""
+    by_shard = {}
+    for pk in wallet_ids:
+        by_shard.setdefault(shard_for_user(pk), []).append(pk)
+    try:
+        for _ in range(transfers):
+            sender_id = random.choice(wallet_ids)
+            pool = (
+                wallet_ids
+                if random.random() < cross_shard
+                else by_shard[shard_for_user(sender_id)]
+            )
+            receiver_id = random.choice([pk for pk in pool if pk != sender_id])
+            with transaction.atomic(using=shard_for_user(sender_id)):
+                sender = Wallet.objects.for_wallet(sender_id).select_for_update().get()
+                receiver = Wallet.objects.for_wallet(receiver_id).get()
+                Transfer.objects.create(
+                    sender=sender, receiver=receiver, amount=Decimal("1.00")
+                )
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Runs micro-benchmarks for the API hot paths"
+
+    scenarios = ["serialization", "rows", "startup", "sharding"]
+
+    def add_arguments(self, parser):
+        parser.add_argument("scenario", choices=self.scenarios)
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--max-import-ms",
+            type=float,
+            help="startup: fail when a profile's import time exceeds this budget",
+        )
+        parser.add_argument(
+            "--shards",
+            default="1,2,4",
+            help="sharding: comma-separated shard counts to compare",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="sharding: worker processes sending transfers",
+        )
+        parser.add_argument(
+            "--cross-shard",
+            type=float,
+            default=0.0,
+            help="sharding: fraction of transfers between wallets on different shards",
+        )
+
+    def handle(self, *args, **options):
+        if options["rows"] <= 0 or options["repeat"] <= 0:
+            raise CommandError("--rows and --repeat must be positive")
+        getattr(self, f"bench_{options['scenario']}")(**options)
+
+    def timeit(self, label, func, rows, repeat):
+        func()  # warm up
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        per_thousand = best * 1000 / rows * 1000
+        self.stdout.write(f"{label:<40} {per_thousand:8.2f} ms / 1,000 rows")
+        return best
+
+    def fake_transactions(self, rows):
+        wallet = Wallet(pk=1)
+        now = timezone.now()
+        return [
+            Transaction(
+                pk=i,
+                wallet=wallet,
+                amount=Decimal(random.randint(1, 10**6)) / 100,
+                transaction_type="TRANSFER",
+                transfer=Transfer(pk=i, description=f"Payment #{i}"),
+                counterparty=Wallet(pk=i + 1, user=User(email=f"user{i}@example.com")),
+                counterparty_email=f"user{i}@example.com",
+                created_at=now,
+            )
+            for i in range(1, rows + 1)
+        ]
+
+    def as_row(self, transaction):
+        return {
+            "id": transaction.pk,
+            "amount": transaction.amount,
+            "transaction_type": transaction.transaction_type,
+            "description": transaction.description,
+            "transfer__description": transaction.transfer.description,
+            "counterparty_email": transaction.counterparty_email,
+            "created_at": transaction.created_at,
+        }
+
+    def bench_serialization(self, rows, repeat, **options):
+        transactions = self.fake_transactions(rows)
+        data = TransactionSerializer(transactions, many=True).data
+        raw = [
+            {
+                "id": t.pk,
+                "amount": t.amount,
+                "transaction_type": t.transaction_type,
+                "description": t.get_description(),
+                "created_at": t.created_at,
+            }
+            for t in transactions
+        ]
+
+        self.timeit(
+            "serializer (TransactionSerializer)",
+            lambda: TransactionSerializer(transactions, many=True).data,
+            rows,
+            repeat,
+        )
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            name = type(renderer).__name__
+            self.timeit(f"render {name}", lambda: renderer.render(data), rows, repeat)
+            self.timeit(
+                f"render {name} (Decimal/datetime)",
+                lambda: renderer.render(raw),
+                rows,
+                repeat,
+            )
+
+    def bench_rows(self, rows, repeat, **options):
+        transactions = self.fake_transactions(rows)
+        values = [self.as_row(t) for t in transactions]
+        self.timeit(
+            "TransactionSerializer(many=True)",
+            lambda: TransactionSerializer(transactions, many=True).data,
+            rows,
+            repeat,
+        )
+        self.timeit(
+            "transaction_rows.serialize_many",
+            lambda: transaction_rows.serialize_many(values),
+            rows,
+            repeat,
+        )
+
+    startup_code = (
+        "import digital_wallet_api.wsgi, django.urls; "
+        "django.urls.get_resolver().url_patterns"
+    )
+
+    def import_times(self, env):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", self.startup_code],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        modules = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, cumulative_us, name = line[len("import time:") :].split("|")
+            modules.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+        return modules
+
+    def bench_startup(self, repeat, max_import_ms=None, **options):
+        over_budget = []
+        for profile, api_only in (("full", "False"), ("api-only", "True")):
+            env = {**os.environ, "API_ONLY": api_only}
+            runs = [self.import_times(env) for _ in range(repeat)]
+            totals = [sum(self_us for self_us, _, _ in run) / 1000 for run in runs]
+            best = min(totals)
+            self.stdout.write(
+                f"{profile:<10} imports {len(runs[0]):5d} modules, best {best:8.1f} ms "
+                f"(median {sorted(totals)[len(totals) // 2]:.1f} ms)"
+            )
+            slowest = sorted(
+                (
+                    item
+                    for item in runs[totals.index(best)]
+                    if not item[2].startswith(" ")
+                ),
+                key=lambda item: item[1],
+                reverse=True,
+            )
+            for _, cumulative_us, name in slowest[:5]:
+                self.stdout.write(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+            if max_import_ms is not None and best > max_import_ms:
+                over_budget.append(f"{profile} ({best:.1f} ms)")
+
+        if over_budget:
+            raise CommandError(
+                f"Import time over {max_import_ms} ms budget: {', '.join(over_budget)}"
+            )
+
+    def add_shards(self, directory, count):
+        """Registers ``count`` throwaway SQLite databases and migrates them."""
+        aliases = [f"bench_shard_{count}_{i}" for i in range(count)]
+        for alias in aliases:
+            connections.settings[alias] = connections.configure_settings(
+                {
+                    **connections.settings,
+                    alias: {
+                        "ENGINE": "django.db.backends.sqlite3",
+                        "NAME": os.path.join(directory, f"{alias}.sqlite3"),
+                        # Take the write lock up front instead of failing to
+                        # upgrade a read lock under contention.
+                        "OPTIONS": {"timeout": 30, "transaction_mode": "IMMEDIATE"},
+                    },
+                }
+            )[alias]
+            call_command("migrate", database=alias, verbosity=0)
+        return aliases
+
+    def bench_sharding(self, rows, shards, workers, cross_shard, **options):
+        counts = [int(count) for count in shards.split(",")]
+        for count in counts:
+            with tempfile.TemporaryDirectory() as directory:
+                aliases = self.add_shards(directory, count)
+                with override_settings(WALLET_SHARDS=aliases):
+                    wallet_ids = list(range(1, 8 * count + 1))
+                    for pk in wallet_ids:
+                        user = User.objects.using(shard_for_user(pk)).create(
+                            pk=pk,
+                            email=f"bench{pk}@example.com",
+                            username=f"bench{pk}",
+                            cpf=f"{pk:011d}",
+                        )
+                        Wallet.objects.create(user=user, balance=Decimal("1000000"))
+
+                    # Forked processes inherit the shard settings; connections
+                    # must not be shared with them.
+                    connections.close_all()
+                    per_worker = max(rows // workers, 1)
+                    started = time.perf_counter()
+                    with ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=multiprocessing.get_context("fork"),
+                    ) as pool:
+                        futures = [
+                            pool.submit(
+                                run_transfers, wallet_ids, per_worker, cross_shard
+                            )
+                            for _ in range(workers)
+                        ]
+                        for future in futures:
+                            future.result()
+                    elapsed = time.perf_counter() - started
+
+                    total = per_worker * workers
+                    self.stdout.write(
+                        f"{count} shard(s), {workers} workers: {total} transfers in "
+                        f"{elapsed:.2f}s ({total / elapsed:8.1f} transfers/s)"
+                    )
+                for alias in aliases:
+                    connections[alias].close()
+                    del connections.settings[alias]
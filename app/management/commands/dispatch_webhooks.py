@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from app.models import WebhookDelivery, WebhookSubscription
+from app.webhooks import deliver, retry_delay
+
+
+class Command(BaseCommand):
+    help = "Delivers pending webhooks; several workers can run in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Maximum number of requests in flight",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=2.0,
+            help="Seconds to sleep when there is nothing due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as there is nothing due",
+        )
+
+    def handle(self, *args, **options):
+        self.config = settings.WEBHOOKS
+        # The lease must outlast the whole batch: each wave of requests can
+        # wait TIMEOUT on the connect and again on the response.
+        waves = math.ceil(options["batch_size"] / options["concurrency"])
+        self.lease = timedelta(
+            seconds=max(self.config["LEASE"], waves * 2 * self.config["TIMEOUT"])
+        )
+        delivered = failed = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            try:
+                while True:
+                    batch_delivered, batch_failed = self.run_batch(
+                        pool, options["batch_size"]
+                    )
+                    delivered += batch_delivered
+                    failed += batch_failed
+                    if batch_delivered + batch_failed == 0:
+                        if options["once"]:
+                            break
+                        time.sleep(options["poll_interval"])
+            except KeyboardInterrupt:
+                pass
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Delivered {delivered} webhooks ({failed} failed attempts) in {elapsed:.2f}s "
+                f"({delivered / elapsed if elapsed else 0:.1f} deliveries/s)"
+            )
+        )
+
+    def claim(self, batch_size, now):
+        leased_until = now + self.lease
+        with transaction.atomic():
+            due = list(
+                WebhookDelivery.objects.select_for_update(
+                    skip_locked=True, of=("self",)
+                )
+                .select_related("subscription")
+                .filter(
+                    Q(subscription__circuit_open_until__isnull=True)
+                    | Q(subscription__circuit_open_until__lte=now),
+                    status="PENDING",
+                    next_attempt_at__lte=now,
+                    subscription__is_active=True,
+                )
+                .order_by("next_attempt_at")[:batch_size]
+            )
+            # The HTTP calls happen outside this transaction, so claimed rows
+            # are leased instead of kept locked. A crashed worker's rows come
+            # back once the lease expires.
+            WebhookDelivery.objects.filter(pk__in=[d.pk for d in due]).update(
+                next_attempt_at=leased_until
+            )
+        return due, leased_until
+
+    def send(self, delivery):
+        # Stop calling an endpoint once it has failed enough times in this batch.
+        if (
+            self.batch_failures[delivery.subscription_id]
+            >= self.config["CIRCUIT_THRESHOLD"]
+        ):
+            return None
+        result = deliver(delivery, self.config["TIMEOUT"])
+        if result[1]:
+            with self.lock:
+                self.batch_failures[delivery.subscription_id] += 1
+        return result
+
+    def run_batch(self, pool, batch_size):
+        started = time.perf_counter()
+        due, leased_until = self.claim(batch_size, timezone.now())
+        if not due:
+            return 0, 0
+
+        self.batch_failures, self.lock = Counter(), threading.Lock()
+        results = list(pool.map(self.send, due))
+        delivered, failed = self.record(due, results, leased_until)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Batch of {len(due)}: {delivered} delivered, {failed} failed in "
+            f"{elapsed * 1000:.1f}ms ({delivered / elapsed:.1f} deliveries/s)"
+        )
+        return delivered, failed
+
+    def record(self, due, results, leased_until):
+        now = timezone.now()
+        succeeded, failures = set(), Counter()
+        for delivery, result in zip(due, results):
+            if result is None:
+                # Skipped by the breaker: handed back now without using an
+                # attempt, or parked below if the circuit opened.
+                delivery.next_attempt_at = now
+                continue
+            status_code, error = result
+            delivery.attempts += 1
+            delivery.last_status_code = status_code
+            delivery.last_error = error
+            if not error:
+                delivery.status = "DELIVERED"
+                delivery.delivered_at = now
+                succeeded.add(delivery.subscription_id)
+            else:
+                failures[delivery.subscription_id] += 1
+                if delivery.attempts >= self.config["MAX_ATTEMPTS"]:
+                    delivery.status = "FAILED"
+                else:
+                    delivery.next_attempt_at = now + retry_delay(delivery.attempts)
+
+        open_until = now + timedelta(seconds=self.config["CIRCUIT_COOLDOWN"])
+        with transaction.atomic():
+            # Only rows this worker still leases: once a lease runs out the row
+            # belongs to whichever worker claimed it next.
+            leased = set(
+                WebhookDelivery.objects.select_for_update()
+                .filter(
+                    pk__in=[delivery.pk for delivery in due],
+                    status="PENDING",
+                    next_attempt_at=leased_until,
+                )
+                .values_list("pk", flat=True)
+            )
+            WebhookDelivery.objects.bulk_update(
+                [delivery for delivery in due if delivery.pk in leased],
+                [
+                    "status",
+                    "attempts",
+                    "next_attempt_at",
+                    "last_status_code",
+                    "last_error",
+                    "delivered_at",
+                ],
+            )
+            WebhookSubscription.objects.filter(pk__in=succeeded).update(
+                consecutive_failures=0, circuit_open_until=None
+            )
+            for pk, count in failures.items():
+                if pk not in succeeded:
+                    WebhookSubscription.objects.filter(pk=pk).update(
+                        consecutive_failures=F("consecutive_failures") + count
+                    )
+            tripped = list(
+                WebhookSubscription.objects.filter(
+                    pk__in=set(failures) - succeeded,
+                    consecutive_failures__gte=self.config["CIRCUIT_THRESHOLD"],
+                ).values_list("pk", flat=True)
+            )
+            if tripped:
+                WebhookSubscription.objects.filter(pk__in=tripped).update(
+                    circuit_open_until=open_until
+                )
+                # Park the endpoint's queue until the circuit half-opens.
+                WebhookDelivery.objects.filter(
+                    subscription_id__in=tripped,
+                    status="PENDING",
+                    next_attempt_at__lt=open_until,
+                ).update(next_attempt_at=open_until)
+
+        delivered = sum(result is not None and not result[1] for result in results)
+        return delivered, sum(failures.values())
@@ -0,0 +1,72 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app.models import Hold, VelocityBucket, Wallet
+
+
+class Command(BaseCommand):
+    help = "Releases expired holds in batches; several workers can run in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        expired = 0
+        started = time.perf_counter()
+        for shard in settings.WALLET_SHARDS:
+            while True:
+                released = self.run_batch(shard, options["batch_size"])
+                expired += released
+                if released < options["batch_size"]:
+                    break
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Expired {expired} holds in {elapsed:.2f}s "
+                f"({expired / elapsed if elapsed else 0:.1f} holds/s)"
+            )
+        )
+
+    def run_batch(self, shard, batch_size):
+        now = timezone.now()
+        with transaction.atomic(using=shard):
+            # Served by the (status, expires_at) index; holds locked by a
+            # capture, a void or another worker are skipped.
+            due = list(
+                Hold.objects.using(shard)
+                .select_for_update(skip_locked=True)
+                .filter(status="AUTHORIZED", expires_at__lte=now)
+                .order_by("expires_at")
+                .values_list("pk", "wallet_id", "amount", "created_at")[:batch_size]
+            )
+            if not due:
+                return 0
+            Hold.objects.using(shard).filter(pk__in=[pk for pk, _, _, _ in due]).update(
+                status="EXPIRED", closed_at=now
+            )
+            released = defaultdict(int)
+            counted = defaultdict(int)
+            for _, wallet_id, amount, created_at in due:
+                released[wallet_id] += amount
+                minute, _ = VelocityBucket.starts(created_at)
+                counted[wallet_id, minute] += amount
+            # Expired amounts no longer count against the withdrawal limits.
+            # Buckets go before wallet rows, as in Wallet.withdraw(), and wallet
+            # id order keeps concurrent sweepers from deadlocking.
+            for (wallet_id, minute), amount in sorted(counted.items()):
+                VelocityBucket.record(
+                    wallet_id, "WITHDRAWAL", -amount, minute, using=shard
+                )
+            for wallet_id in sorted(released):
+                Wallet.objects.using(shard).filter(pk=wallet_id).update(
+                    held_balance=F("held_balance") - released[wallet_id],
+                    updated_at=now,
+                )
+        return len(due)
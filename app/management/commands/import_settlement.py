@@ -0,0 +1,275 @@
+import csv
+import hashlib
+import io
+import os
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from app.events import transaction_payload
+from app.models import (
+    SettlementEntry,
+    SettlementFile,
+    Transaction,
+    User,
+    Wallet,
+    WebhookDelivery,
+    WebhookSubscription,
+)
+
+MAX_AMOUNT = Decimal(10) ** 10
+
+
+class CSVStream:
+    """Read-only file object that renders rows as CSV for ``COPY ... FROM STDIN``."""
+
+    def __init__(self, rows, chunk_rows=1000):
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+
+    def read(self, size=-1):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(islice(self.rows, self.chunk_rows))
+        return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a partner settlement CSV (columns cpf, amount and optional reference) "
+        "as deposits. Each file is applied once, identified by its SHA-256."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=5000,
+            help="Rows per bulk_create when COPY is not available",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        self.batch_size = options["batch_size"]
+        checksum = self.checksum(path)
+        if SettlementFile.objects.filter(sha256=checksum).exists():
+            self.stdout.write(
+                self.style.WARNING(f"{path} was already imported, nothing to do")
+            )
+            return
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            # The unique checksum also blocks a concurrent import of the same file.
+            settlement = SettlementFile.objects.create(
+                name=os.path.basename(path), sha256=checksum
+            )
+            self.row_count, self.total_amount = 0, Decimal("0")
+            with open(path, newline="", encoding="utf-8-sig") as f:
+                rows = self.parse(csv.reader(f), settlement.pk)
+                if connection.vendor == "postgresql":
+                    self.copy(rows)
+                else:
+                    self.bulk_create(rows)
+            loaded = time.perf_counter() - started
+
+            wallets, applied = self.apply(settlement)
+            settlement.row_count = self.row_count
+            settlement.applied_count = applied
+            settlement.total_amount = self.total_amount
+            settlement.save(
+                update_fields=["row_count", "applied_count", "total_amount"]
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"Loaded {self.row_count} rows in {loaded:.2f}s "
+            f"({self.row_count / loaded if loaded else 0:.0f} rows/s)"
+        )
+        unmatched = self.row_count - applied
+        if unmatched:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{unmatched} rows have no wallet for their CPF and were kept in "
+                    f"staging (settlement file {settlement.pk})"
+                )
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Applied {applied} deposits to {wallets} wallets in {elapsed:.2f}s "
+                f"({self.row_count / elapsed if elapsed else 0:.0f} rows/s)"
+            )
+        )
+
+    def checksum(self, path):
+        digest = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        return digest.hexdigest()
+
+    def parse(self, reader, file_id):
+        header = [column.strip().lower() for column in next(reader, [])]
+        if "cpf" not in header or "amount" not in header:
+            raise CommandError("Settlement file must have cpf and amount columns")
+        cpf_index, amount_index = header.index("cpf"), header.index("amount")
+        reference_index = header.index("reference") if "reference" in header else None
+
+        for line, row in enumerate(reader, start=2):
+            if not row:
+                continue
+            try:
+                cpf = row[cpf_index].strip()
+                amount = Decimal(row[amount_index].strip())
+            except (IndexError, InvalidOperation):
+                raise CommandError(f"Line {line}: malformed row {row!r}")
+            if not (len(cpf) == 11 and cpf.isdigit()):
+                raise CommandError(f"Line {line}: invalid CPF {cpf!r}")
+            # Checked in this order: NaN cannot be compared and quantizing a
+            # huge exponent raises. SettlementEntry.amount holds 10 integer digits.
+            if (
+                not amount.is_finite()
+                or amount <= 0
+                or amount >= MAX_AMOUNT
+                or amount != amount.quantize(Decimal("0.01"))
+            ):
+                raise CommandError(f"Line {line}: invalid amount {amount}")
+            reference = (
+                row[reference_index].strip() if reference_index is not None else ""
+            )
+
+            self.row_count += 1
+            self.total_amount += amount
+            yield file_id, line, cpf, amount, reference[:100]
+
+    def copy(self, rows):
+        table = connection.ops.quote_name(SettlementEntry._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} (file_id, line, cpf, amount, reference) "
+                "FROM STDIN WITH (FORMAT csv)",
+                CSVStream(rows),
+            )
+
+    def bulk_create(self, rows):
+        while True:
+            batch = [
+                SettlementEntry(
+                    file_id=file_id,
+                    line=line,
+                    cpf=cpf,
+                    amount=amount,
+                    reference=reference,
+                )
+                for file_id, line, cpf, amount, reference in islice(
+                    rows, self.batch_size
+                )
+            ]
+            if not batch:
+                break
+            SettlementEntry.objects.bulk_create(batch)
+
+    def apply(self, settlement):
+        """
+        Resolves wallets by CPF, then applies the whole file with one UPDATE
+        for the balances and one INSERT ... SELECT for the ledger rows, and
+        writes the deposit.created outbox rows in the same transaction.
+        """
+        quote = connection.ops.quote_name
+        entries = quote(SettlementEntry._meta.db_table)
+        wallets = quote(Wallet._meta.db_table)
+        users = quote(User._meta.db_table)
+        ledger = quote(Transaction._meta.db_table)
+        now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {entries} SET wallet_id = w.id "
+                f"FROM {wallets} w JOIN {users} u ON u.id = w.user_id "
+                f"WHERE {entries}.file_id = %s AND u.cpf = {entries}.cpf",
+                [settlement.pk],
+            )
+            if connection.features.has_select_for_update:
+                # Take the row locks in primary key order, like transfers do,
+                # so the bulk update cannot deadlock with them.
+                cursor.execute(
+                    f"SELECT count(*) FROM (SELECT id FROM {wallets} WHERE id IN "
+                    f"(SELECT wallet_id FROM {entries} WHERE file_id = %s) "
+                    "ORDER BY id FOR UPDATE) locked",
+                    [settlement.pk],
+                )
+            cursor.execute(
+                f"UPDATE {wallets} SET balance = {wallets}.balance + t.total, "
+                "updated_at = %s "
+                f"FROM (SELECT wallet_id, SUM(amount) AS total FROM {entries} "
+                "WHERE file_id = %s AND wallet_id IS NOT NULL GROUP BY wallet_id) t "
+                f"WHERE {wallets}.id = t.wallet_id",
+                [now, settlement.pk],
+            )
+            wallet_count = cursor.rowcount
+            # The wallets are locked, so their ledger rows above this id are
+            # the ones inserted below.
+            cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {ledger}")
+            last_ledger_id = cursor.fetchone()[0]
+            cursor.execute(
+                f"INSERT INTO {ledger} "
+                "(wallet_id, amount, transaction_type, description, "
+                "counterparty_email, created_at) "
+                "SELECT wallet_id, amount, 'DEPOSIT', '', '', %s "
+                f"FROM {entries} WHERE file_id = %s AND wallet_id IS NOT NULL "
+                "ORDER BY line",
+                [now, settlement.pk],
+            )
+            applied = cursor.rowcount
+
+        self.enqueue_webhooks(settlement, last_ledger_id)
+        SettlementEntry.objects.filter(file=settlement, wallet__isnull=False).delete()
+        return wallet_count, applied
+
+    def enqueue_webhooks(self, settlement, last_ledger_id):
+        """
+        Bulk-inserts deposit.created deliveries for the new ledger rows of
+        wallets whose owner has an active webhook; only those rows are read
+        back. Each payload carries the balance right after its row, worked
+        out backwards from the wallet's final balance.
+        """
+        subscriptions = {}
+        for pk, wallet_id in WebhookSubscription.objects.filter(
+            is_active=True,
+            user__wallet__in=SettlementEntry.objects.filter(
+                file=settlement, wallet__isnull=False
+            ).values("wallet_id"),
+        ).values_list("pk", "user__wallet"):
+            subscriptions.setdefault(wallet_id, []).append(pk)
+        if not subscriptions:
+            return
+
+        balances = dict(
+            Wallet.objects.filter(pk__in=subscriptions).values_list("pk", "balance")
+        )
+        deliveries = []
+        entries = Transaction.objects.filter(
+            wallet_id__in=subscriptions, pk__gt=last_ledger_id
+        ).order_by("-id")
+        for entry in entries.iterator():
+            balance = balances[entry.wallet_id]
+            payload = {
+                "event": "deposit.created",
+                **transaction_payload(entry, balance),
+            }
+            deliveries.extend(
+                WebhookDelivery(
+                    subscription_id=pk, event="deposit.created", payload=payload
+                )
+                for pk in subscriptions[entry.wallet_id]
+            )
+            balances[entry.wallet_id] = balance - entry.amount
+        deliveries.reverse()
+        WebhookDelivery.objects.bulk_create(deliveries, batch_size=self.batch_size)
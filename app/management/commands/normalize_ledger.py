@@ -0,0 +1,176 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from app.models import Transaction, Transfer
+
+
+class Command(BaseCommand):
+    help = (
+        "Replaces stored ledger descriptions with transfer/counterparty references. "
+        "Runs in batches and can be interrupted and resumed."
+    )
+
+    # Ledger rows are written right after their transfer in the same
+    # transaction, so they are looked up in this window after created_at.
+    match_window = timedelta(minutes=5)
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        self.batch_size = options["batch_size"]
+        self.dry_run = options["dry_run"]
+        size_before = self.table_size()
+        started = time.perf_counter()
+
+        plain_rows, plain_bytes = self.normalize_deposits_and_withdrawals()
+        transfer_rows, transfer_bytes = self.normalize_transfers()
+
+        elapsed = time.perf_counter() - started
+        rows = plain_rows + transfer_rows
+        self.stdout.write(
+            f"Normalized {rows} rows ({plain_rows} deposits/withdrawals, "
+            f"{transfer_rows} transfers) in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else 0:.0f} rows/s)"
+        )
+        self.stdout.write(
+            f"Description text removed: {plain_bytes + transfer_bytes:,} bytes"
+        )
+        if size_before is not None:
+            self.stdout.write(
+                f"app_transaction size: {size_before:,} -> {self.table_size():,} bytes "
+                "(run VACUUM FULL or pg_repack to return the space to the OS)"
+            )
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING("Dry run, nothing was written"))
+
+    def table_size(self):
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_total_relation_size('app_transaction')")
+            return cursor.fetchone()[0]
+
+    def normalize_deposits_and_withdrawals(self):
+        prefixes = {"DEPOSIT": "Deposit of ", "WITHDRAWAL": "Withdrawal of "}
+        normalized = removed_bytes = 0
+        last_id = 0
+        while True:
+            batch = list(
+                Transaction.objects.filter(
+                    pk__gt=last_id, transaction_type__in=list(prefixes)
+                )
+                .exclude(description="")
+                .order_by("pk")
+                .values("pk", "transaction_type", "amount", "description")[
+                    : self.batch_size
+                ]
+            )
+            if not batch:
+                break
+            last_id = batch[-1]["pk"]
+
+            ids = []
+            for row in batch:
+                # Only text describe() renders identically is dropped, so
+                # "Deposit of 5" or free text stays as written.
+                rendered = Transaction.describe(
+                    row["transaction_type"], row["amount"], "", None, None
+                )
+                if row["description"] == rendered:
+                    ids.append(row["pk"])
+                    removed_bytes += len(row["description"].encode())
+
+            if ids and not self.dry_run:
+                Transaction.objects.filter(pk__in=ids).update(description="")
+            normalized += len(ids)
+        return normalized, removed_bytes
+
+    def normalize_transfers(self):
+        normalized = removed_bytes = 0
+        last_id = 0
+        while True:
+            transfers = list(
+                Transfer.objects.filter(pk__gt=last_id)
+                .select_related("sender__user", "receiver__user")
+                .order_by("pk")[: self.batch_size]
+            )
+            if not transfers:
+                break
+            last_id = transfers[-1].pk
+
+            candidates = {}
+            for row in (
+                Transaction.objects.filter(
+                    transaction_type="TRANSFER",
+                    transfer__isnull=True,
+                    wallet_id__in={
+                        wallet_id
+                        for transfer in transfers
+                        for wallet_id in (transfer.sender_id, transfer.receiver_id)
+                    },
+                    created_at__gte=min(t.created_at for t in transfers),
+                    created_at__lte=max(t.created_at for t in transfers)
+                    + self.match_window,
+                )
+                .only("pk", "wallet_id", "amount", "description")
+                .order_by("pk")
+            ):
+                candidates.setdefault(
+                    (row.wallet_id, row.amount, row.description), []
+                ).append(row)
+
+            updated = []
+            for transfer in transfers:
+                memo = transfer.description or "No description"
+                legs = [
+                    (
+                        transfer.sender_id,
+                        -transfer.amount,
+                        f"Transfer to {transfer.receiver.user.email}: {memo}",
+                        transfer.receiver_id,
+                        transfer.receiver.user.email,
+                    ),
+                    (
+                        transfer.receiver_id,
+                        transfer.amount,
+                        f"Transfer from {transfer.sender.user.email}: {memo}",
+                        transfer.sender_id,
+                        transfer.sender.user.email,
+                    ),
+                ]
+                for (
+                    wallet_id,
+                    amount,
+                    description,
+                    counterparty_id,
+                    counterparty_email,
+                ) in legs:
+                    rows = candidates.get((wallet_id, amount, description))
+                    if not rows:
+                        continue
+                    row = rows.pop(0)
+                    removed_bytes += len(row.description.encode())
+                    row.transfer = transfer
+                    row.counterparty_id = counterparty_id
+                    row.counterparty_email = counterparty_email
+                    row.description = ""
+                    updated.append(row)
+
+            if updated and not self.dry_run:
+                with transaction.atomic():
+                    Transaction.objects.bulk_update(
+                        updated,
+                        [
+                            "transfer",
+                            "counterparty",
+                            "counterparty_email",
+                            "description",
+                        ],
+                    )
+            normalized += len(updated)
+        return normalized, removed_bytes
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from app.models import VelocityBucket
+
+
+class Command(BaseCommand):
+    help = "Deletes velocity buckets that no limit window can reach anymore"
+
+    def handle(self, *args, **options):
+        deleted, _ = VelocityBucket.objects.filter(
+            start__lt=timezone.now() - timedelta(hours=25)
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} velocity buckets"))
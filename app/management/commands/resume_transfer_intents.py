@@ -0,0 +1,61 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from app.models import TransferIntent
+
+
+class Command(BaseCommand):
+    help = "Finishes cross-shard transfers whose credit was interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--grace",
+            type=float,
+            default=30.0,
+            help="Seconds an intent may stay debited before it is retried",
+        )
+
+    def handle(self, *args, **options):
+        completed = reversed_ = failed = 0
+        started = time.perf_counter()
+        cutoff = timezone.now() - timedelta(seconds=options["grace"])
+        for shard in settings.WALLET_SHARDS:
+            with transaction.atomic(using=shard):
+                # Locked until the batch commits, so parallel runs skip them.
+                due = list(
+                    TransferIntent.objects.using(shard)
+                    .select_for_update(skip_locked=True)
+                    .filter(status="DEBITED", updated_at__lt=cutoff)
+                    .order_by("updated_at")[: options["batch_size"]]
+                )
+                for intent in due:
+                    try:
+                        with transaction.atomic(using=shard):
+                            intent.apply()
+                    except DatabaseError as e:
+                        TransferIntent.objects.using(shard).filter(pk=intent.pk).update(
+                            attempts=F("attempts") + 1,
+                            last_error=str(e),
+                            updated_at=timezone.now(),
+                        )
+                        failed += 1
+                        continue
+                    if intent.status == "COMPLETED":
+                        completed += 1
+                    else:
+                        reversed_ += 1
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Completed {completed} transfer intents, reversed {reversed_}, "
+                f"{failed} still pending in {elapsed:.2f}s"
+            )
+        )
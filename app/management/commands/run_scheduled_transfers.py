@@ -0,0 +1,139 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from app.models import ScheduledTransfer
+
+
+class Command(BaseCommand):
+    help = "Executes due scheduled transfers; several workers can run in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument(
+            "--lease",
+            type=float,
+            default=300.0,
+            help="Seconds a claimed row is hidden from other workers",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when there is nothing due",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit as soon as there is nothing due",
+        )
+
+    def handle(self, *args, **options):
+        executed = failed = 0
+        started = time.perf_counter()
+        try:
+            while True:
+                batch_executed = batch_failed = 0
+                # Scheduled transfers live on their sender's shard.
+                for shard in settings.WALLET_SHARDS:
+                    shard_executed, shard_failed = self.run_batch(
+                        shard, options["batch_size"], options["lease"]
+                    )
+                    batch_executed += shard_executed
+                    batch_failed += shard_failed
+                executed += batch_executed
+                failed += batch_failed
+                if batch_executed + batch_failed == 0:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            pass
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Executed {executed} scheduled transfers ({failed} failed) in {elapsed:.2f}s "
+                f"({(executed + failed) / elapsed if elapsed else 0:.1f} runs/s)"
+            )
+        )
+
+    def run_batch(self, shard, batch_size, lease):
+        executed = failed = 0
+        started = time.perf_counter()
+        now = timezone.now()
+        leased_until = now + timedelta(seconds=lease)
+
+        with transaction.atomic(using=shard):
+            # Claim by pushing next_run_at past the lease and commit right away:
+            # other workers skip the rows without waiting on our locks, and a
+            # worker that dies mid-batch only delays its rows by the lease.
+            due = list(
+                ScheduledTransfer.objects.using(shard)
+                .select_for_update(skip_locked=True)
+                .filter(is_active=True, next_run_at__lte=now)
+                .order_by("next_run_at")[:batch_size]
+            )
+            ScheduledTransfer.objects.using(shard).filter(
+                pk__in=[s.pk for s in due]
+            ).update(next_run_at=leased_until)
+
+        for scheduled in due:
+            try:
+                outcome = self.run_one(scheduled, now, leased_until)
+            except DatabaseError as e:
+                # The run rolled back; keep the lease so the row is retried.
+                ScheduledTransfer.objects.using(shard).filter(
+                    pk=scheduled.pk, next_run_at=leased_until
+                ).update(last_error=str(e), last_run_at=now)
+                outcome = False
+            if outcome is True:
+                executed += 1
+            elif outcome is False:
+                failed += 1
+
+        if due:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"Batch of {len(due)}: {executed} executed, {failed} failed in "
+                f"{elapsed * 1000:.1f}ms ({len(due) / elapsed:.1f} runs/s)"
+            )
+        return executed, failed
+
+    def run_one(self, scheduled, now, leased_until):
+        """
+        Executes one claimed row in its own transaction, together with its
+        bookkeeping, so a crash never records a run without its transfer (or
+        the reverse). Returns None when the lease expired and another worker
+        re-claimed the row.
+        """
+        shard = scheduled._state.db
+        with transaction.atomic(using=shard):
+            claimed = (
+                ScheduledTransfer.objects.using(shard)
+                .select_for_update()
+                .filter(pk=scheduled.pk, next_run_at=leased_until)
+                .exists()
+            )
+            if not claimed:
+                return None
+            succeeded = True
+            try:
+                with transaction.atomic(using=shard):
+                    scheduled.execute()
+                scheduled.run_count += 1
+                scheduled.last_error = ""
+            except ValueError as e:
+                scheduled.last_error = str(e)
+                succeeded = False
+            scheduled.last_run_at = now
+            # next_run_at still holds the claimed slot, not the lease.
+            scheduled.next_run_at = scheduled.compute_next_run(now)
+            scheduled.save(
+                update_fields=["run_count", "last_error", "last_run_at", "next_run_at"]
+            )
+        return succeeded
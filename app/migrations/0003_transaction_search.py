@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-19 18:52
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+def search_indexes():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+
+    return [
+        # Must match the expressions used by TransactionQuerySet.search().
+        GinIndex(
+            SearchVector("description", config="simple"),
+            name="transaction_description_fts",
+        ),
+        GinIndex(
+            OpClass(Upper("description"), name="gin_trgm_ops"),
+            name="transaction_description_trgm",
+        ),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Transaction = apps.get_model("app", "Transaction")
+    for index in search_indexes():
+        schema_editor.add_index(Transaction, index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Transaction = apps.get_model("app", "Transaction")
+    for index in search_indexes():
+        schema_editor.remove_index(Transaction, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0002_scheduledtransfer"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
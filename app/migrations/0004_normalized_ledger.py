@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 18:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0003_transaction_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="counterparty",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="app.wallet",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="transfer",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="ledger_entries",
+                to="app.transfer",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="transaction",
+            name="description",
+            field=models.TextField(blank=True, default=""),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0004_normalized_ledger"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["wallet", "id"], name="transaction_wallet_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,118 @@
+# Generated by Django 5.2 on 2026-10-19 18:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0007_webhooks"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LimitTier",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=50, unique=True)),
+                (
+                    "hourly_transfer_limit",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "daily_transfer_limit",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "hourly_withdrawal_limit",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+                (
+                    "daily_withdrawal_limit",
+                    models.DecimalField(
+                        blank=True, decimal_places=2, max_digits=12, null=True
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="limit_tier",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="users",
+                to="app.limittier",
+            ),
+        ),
+        migrations.CreateModel(
+            name="VelocityBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("TRANSFER", "Transfer"),
+                            ("WITHDRAWAL", "Withdrawal"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                (
+                    "period",
+                    models.CharField(
+                        choices=[("MINUTE", "Minute"), ("HOUR", "Hour")], max_length=6
+                    ),
+                ),
+                ("start", models.DateTimeField()),
+                (
+                    "amount",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=14),
+                ),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="velocity_buckets",
+                        to="app.wallet",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(fields=["start"], name="velocity_bucket_start_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("wallet", "kind", "period", "start"),
+                        name="velocity_bucket_unique",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-19 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0008_velocity_limits"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["wallet", "created_at"], name="transaction_wallet_created_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 19:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0011_holds"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(fields=["created_at"], name="transaction_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="transfer",
+            index=models.Index(fields=["created_at"], name="transfer_created_idx"),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations
+from django.db.models.functions import Upper
+
+
+def search_indexes():
+    from django.contrib.postgres.indexes import GinIndex, OpClass
+    from django.contrib.postgres.search import SearchVector
+
+    # Must match the subqueries of TransactionQuerySet.search().
+    return [
+        (
+            "Transfer",
+            GinIndex(
+                SearchVector("description", config="simple"),
+                name="transfer_description_fts",
+            ),
+        ),
+        (
+            "Transfer",
+            GinIndex(
+                OpClass(Upper("description"), name="gin_trgm_ops"),
+                name="transfer_description_trgm",
+            ),
+        ),
+        (
+            "User",
+            GinIndex(
+                OpClass(Upper("email"), name="gin_trgm_ops"),
+                name="user_email_trgm",
+            ),
+        ),
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name, index in search_indexes():
+        schema_editor.add_index(apps.get_model("app", model_name), index)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for model_name, index in search_indexes():
+        schema_editor.remove_index(apps.get_model("app", model_name), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0012_admin_date_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2 on 2026-10-19 19:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def copy_counterparty_emails(apps, schema_editor):
+    Transaction = apps.get_model("app", "Transaction")
+    Wallet = apps.get_model("app", "Wallet")
+    db = schema_editor.connection.alias
+    email = Wallet.objects.using(db).filter(pk=OuterRef("counterparty_id"))
+    # Counterparties on another shard are not found here; those rows carry
+    # their full description already.
+    Transaction.objects.using(db).filter(counterparty__isnull=False).update(
+        counterparty_email=Coalesce(
+            Subquery(email.values("user__email")[:1]), Value("")
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0013_memo_email_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="counterparty_email",
+            field=models.EmailField(blank=True, default="", max_length=254),
+        ),
+        migrations.RunPython(copy_counterparty_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2 on 2026-10-19 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0014_transaction_counterparty_email"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="scheduledtransfer",
+            name="receiver",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="incoming_scheduled_transfers",
+                to="app.wallet",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2 on 2026-10-19 19:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("app", "0015_scheduledtransfer_receiver_across_shards"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="hold",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now, editable=False
+            ),
+        ),
+    ]
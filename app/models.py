@@ -1,12 +1,65 @@
+import secrets
+import uuid
+from datetime import timedelta
 from decimal import ROUND_DOWN, Decimal
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.core.validators import MinValueValidator
-from django.db import models, transaction
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    connections,
+    models,
+    transaction,
+)
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from .events import publish_transaction, transaction_payload
+from .schedules import CronSchedule
+from .sharding import db_for, is_sharded, shard_for_user, shard_for_wallet
+from .tracing import span
+
+
+class LimitTier(models.Model):
+    """Rolling-window outflow limits; an empty limit means unlimited."""
+
+    name = models.CharField(max_length=50, unique=True)
+    hourly_transfer_limit = models.DecimalField(
+        max_digits=12, decimal_places=2, blank=True, null=True
+    )
+    daily_transfer_limit = models.DecimalField(
+        max_digits=12, decimal_places=2, blank=True, null=True
+    )
+    hourly_withdrawal_limit = models.DecimalField(
+        max_digits=12, decimal_places=2, blank=True, null=True
+    )
+    daily_withdrawal_limit = models.DecimalField(
+        max_digits=12, decimal_places=2, blank=True, null=True
+    )
+
+    def __str__(self):
+        return self.name
+
+    def limits(self, kind):
+        kind = kind.lower()
+        return getattr(self, f"hourly_{kind}_limit"), getattr(
+            self, f"daily_{kind}_limit"
+        )
 
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
     cpf = models.CharField(max_length=11, unique=True)
+    limit_tier = models.ForeignKey(
+        LimitTier,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="users",
+    )
 
     groups = models.ManyToManyField(
         Group,
@@ -27,46 +80,229 @@ class User(AbstractUser):
         return self.email
 
 
+class WalletQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """The wallet of ``user`` (an instance or id), read from its shard."""
+        user_id = getattr(user, "pk", user)
+        return self.using(shard_for_user(user_id)).filter(user_id=user_id)
+
+    def for_wallet(self, wallet_id):
+        return self.using(shard_for_wallet(wallet_id)).filter(pk=wallet_id)
+
+
 class Wallet(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="wallet")
     balance = models.DecimalField(
         max_digits=12, decimal_places=2, default=0.00, validators=[MinValueValidator(0)]  # type: ignore
     )
+    # Sum of authorized holds; only changed by Hold with conditional updates.
+    held_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = WalletQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(balance__gte=F("held_balance")),
+                name="wallet_balance_covers_holds",
+            )
+        ]
+
     def __str__(self):
         return f"{self.user.email}'s Wallet"
 
-    def deposit(self, amount):
+    @property
+    def available_balance(self):
+        return Decimal(self.balance) - Decimal(self.held_balance)
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            # New wallets go to their owner's shard and, once there is more
+            # than one, take the owner's id so a wallet id alone says which
+            # shard to read.
+            kwargs["using"] = shard_for_user(self.user_id)
+            if is_sharded():
+                self.pk = self.pk or self.user_id
+        super().save(*args, **kwargs)
+
+    def deposit(self, amount, webhook_event="deposit.created"):
         if amount <= 0:
             raise ValueError("Deposit amount must be positive")
-        self.balance = Decimal(self.balance) + amount
-        self.save()
-        Transaction.objects.create(
-            wallet=self,
-            amount=Decimal(str(amount)).quantize(Decimal("0.01"), rounding=ROUND_DOWN),
-            transaction_type="DEPOSIT",
-            description=f"Deposit of {amount}",
+        db = db_for(self)
+        with span("wallet.deposit", wallet_id=self.pk), transaction.atomic(using=db):
+            # Includes waiting for the wallet row lock.
+            with span("wallet.balance_update"):
+                self.update_balance(Decimal(str(amount)), using=db)
+            with span("ledger.insert"):
+                entry = Transaction.objects.using(db).create(
+                    wallet=self,
+                    amount=Decimal(str(amount)).quantize(
+                        Decimal("0.01"), rounding=ROUND_DOWN
+                    ),
+                    transaction_type="DEPOSIT",
+                )
+            if webhook_event:
+                with span("webhook.enqueue"):
+                    WebhookDelivery.enqueue(
+                        self.user_id, webhook_event, entry, self.balance, using=db
+                    )
+        transaction.on_commit(
+            partial(publish_transaction, entry, self.balance), using=db
         )
 
-    def withdraw(self, amount):
+    def withdraw(
+        self, amount, webhook_event="withdrawal.created", limit_kind="WITHDRAWAL"
+    ):
         if amount <= 0:
             raise ValueError("Withdrawal amount must be positive")
-        if self.balance < amount:
+        if self.available_balance < amount:
             raise ValueError("Insufficient funds")
-        self.balance -= Decimal(amount)
-        self.save()
-        Transaction.objects.create(
-            wallet=self,
-            amount=Decimal(str(amount)),
-            transaction_type="WITHDRAWAL",
-            description=f"Withdrawal of {amount}",
+        db = db_for(self)
+        with span("wallet.withdraw", wallet_id=self.pk), transaction.atomic(using=db):
+            # Counting first locks this wallet's buckets, so concurrent
+            # withdrawals are checked one after the other.
+            with span("velocity.check", kind=limit_kind):
+                VelocityBucket.record(self.pk, limit_kind, amount, using=db)
+                self.check_velocity(limit_kind, 0)
+            with span("wallet.balance_update"):
+                # Checked again on the locked row: a hold may have been
+                # authorized or a capture settled after this wallet was read.
+                if not self.update_balance(
+                    -Decimal(str(amount)),
+                    balance__gte=F("held_balance") + Decimal(str(amount)),
+                    using=db,
+                ):
+                    raise ValueError("Insufficient funds")
+            with span("ledger.insert"):
+                entry = Transaction.objects.using(db).create(
+                    wallet=self,
+                    amount=Decimal(str(amount)),
+                    transaction_type="WITHDRAWAL",
+                )
+            if webhook_event:
+                with span("webhook.enqueue"):
+                    WebhookDelivery.enqueue(
+                        self.user_id, webhook_event, entry, self.balance, using=db
+                    )
+        transaction.on_commit(
+            partial(publish_transaction, entry, self.balance), using=db
+        )
+
+    def update_balance(self, delta, using, **conditions):
+        """
+        Adds ``delta`` to the stored balance with a relative UPDATE, so writes
+        made since this instance was read (captures, settlement imports,
+        other requests) are kept, then reloads the balances from the now
+        locked row. Returns False if ``conditions`` excluded the row.
+        """
+        updated = (
+            Wallet.objects.using(using)
+            .filter(pk=self.pk, **conditions)
+            .update(balance=F("balance") + delta, updated_at=timezone.now())
         )
+        if updated:
+            self.balance, self.held_balance = (
+                Wallet.objects.using(using)
+                .values_list("balance", "held_balance")
+                .get(pk=self.pk)
+            )
+        return bool(updated)
 
     def get_balance(self):
         return self.balance
 
+    def get_limit_tier(self):
+        tier = LimitTier.objects.filter(users=self.user_id).first()
+        if tier is None and settings.VELOCITY_LIMITS["DEFAULT_TIER"]:
+            tier = LimitTier.objects.filter(
+                name=settings.VELOCITY_LIMITS["DEFAULT_TIER"]
+            ).first()
+        return tier
+
+    def check_velocity(self, kind, amount):
+        """
+        Raises ValueError if moving ``amount`` more would exceed the hourly or
+        daily ``kind`` limit of the owner's tier.
+        """
+        tier = self.get_limit_tier()
+        if tier is None:
+            return
+        hourly_limit, daily_limit = tier.limits(kind)
+        if hourly_limit is None and daily_limit is None:
+            return
+        hourly, daily = VelocityBucket.usage(self.pk, kind, using=db_for(self))
+        label = kind.lower()
+        if hourly_limit is not None and hourly + amount > hourly_limit:
+            raise ValueError(f"Hourly {label} limit of {hourly_limit} exceeded")
+        if daily_limit is not None and daily + amount > daily_limit:
+            raise ValueError(f"Daily {label} limit of {daily_limit} exceeded")
+
+
+class TransactionQuerySet(models.QuerySet):
+    def for_wallet(self, wallet_id):
+        """Ledger rows of a wallet, read from its shard."""
+        return self.using(shard_for_wallet(wallet_id)).filter(wallet_id=wallet_id)
+
+    def search(self, query):
+        """
+        Filters by transfer memo, counterparty email or legacy description
+        text. On PostgreSQL matches are ranked with full-text and trigram
+        similarity; other databases fall back to a case-insensitive match on
+        every term.
+        """
+        if connections[self.db].vendor == "postgresql":
+            from django.contrib.postgres.search import (
+                SearchQuery,
+                SearchRank,
+                SearchVector,
+                TrigramSimilarity,
+            )
+
+            vector = SearchVector("description", config="simple")
+            memo_vector = SearchVector("transfer__description", config="simple")
+            search_query = SearchQuery(query, config="simple", search_type="websearch")
+            # Memos and current emails are matched in their own tables, where
+            # the GIN indexes of migration 0013 apply; an OR across joined
+            # tables would scan them instead. The e-mail stored on the row is
+            # what the history shows, so it matches too.
+            memo_matches = (
+                Transfer.objects.annotate(
+                    search=SearchVector("description", config="simple")
+                )
+                .filter(Q(search=search_query) | Q(description__icontains=query))
+                .values("pk")
+            )
+            email_matches = Wallet.objects.filter(user__email__icontains=query).values(
+                "pk"
+            )
+            return (
+                self.annotate(
+                    search=vector,
+                    rank=SearchRank(vector, search_query)
+                    + SearchRank(memo_vector, search_query)
+                    + TrigramSimilarity("counterparty_email", query),
+                )
+                .filter(
+                    Q(search=search_query)
+                    | Q(description__icontains=query)
+                    | Q(counterparty_email__icontains=query)
+                    | Q(transfer__in=memo_matches)
+                    | Q(counterparty__in=email_matches)
+                )
+                .order_by("-rank", "-created_at")
+            )
+
+        queryset = self
+        for term in query.split():
+            queryset = queryset.filter(
+                Q(description__icontains=term)
+                | Q(transfer__description__icontains=term)
+                | Q(counterparty_email__icontains=term)
+            )
+        return queryset
+
 
 class Transaction(models.Model):
     TRANSACTION_TYPES = [
@@ -80,19 +316,162 @@ class Transaction(models.Model):
     )
     amount = models.DecimalField(max_digits=12, decimal_places=2)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
-    description = models.TextField()
+    # Only set on legacy rows; see describe() and the normalize_ledger command.
+    description = models.TextField(blank=True, default="")
+    transfer = models.ForeignKey(
+        "Transfer",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="ledger_entries",
+    )
+    # May live on another shard, so no database-level constraint.
+    counterparty = models.ForeignKey(
+        Wallet,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        db_constraint=False,
+    )
+    # The counterparty's e-mail when the row was written, so a transfer reads
+    # the same after that user changes their e-mail or closes their account.
+    counterparty_email = models.EmailField(blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = TransactionQuerySet.as_manager()
+
+    # Columns describe() needs, as QuerySet.values() keys.
+    DESCRIPTION_FIELDS = [
+        "transaction_type",
+        "amount",
+        "description",
+        "transfer__description",
+        "counterparty_email",
+    ]
+
+    class Meta:
+        indexes = [
+            # Serves the history ETag (latest id and row count) and since_id
+            # delta syncs with index-only scans.
+            models.Index(fields=["wallet", "id"], name="transaction_wallet_id_idx"),
+            # History ordering and start_date/end_date ranges.
+            models.Index(
+                fields=["wallet", "created_at"], name="transaction_wallet_created_idx"
+            ),
+            # Admin date hierarchy over the whole ledger.
+            models.Index(fields=["created_at"], name="transaction_created_idx"),
+        ]
+
     def __str__(self):
         return f"{self.transaction_type} of {self.amount} for {self.wallet.user.email}"
 
+    @staticmethod
+    def describe(transaction_type, amount, description, memo, counterparty_email):
+        if description:
+            return description
+        if transaction_type == "TRANSFER":
+            direction = "to" if amount < 0 else "from"
+            return (
+                f"Transfer {direction} {counterparty_email or 'a closed account'}: "
+                f"{memo or 'No description'}"
+            )
+        if transaction_type == "DEPOSIT":
+            return f"Deposit of {amount}"
+        return f"Withdrawal of {amount}"
+
+    def get_description(self):
+        return self.describe(
+            self.transaction_type,
+            self.amount,
+            self.description,
+            self.transfer.description if self.transfer else None,
+            self.counterparty_email,
+        )
+
+
+class VelocityBucket(models.Model):
+    """
+    Outflow totals per wallet in minute and hour buckets. A limit check reads
+    at most 60 minute rows and 24 hour rows, however busy the wallet is.
+    """
+
+    KIND_CHOICES = [("TRANSFER", "Transfer"), ("WITHDRAWAL", "Withdrawal")]
+    PERIOD_CHOICES = [("MINUTE", "Minute"), ("HOUR", "Hour")]
+
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="velocity_buckets"
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    period = models.CharField(max_length=6, choices=PERIOD_CHOICES)
+    start = models.DateTimeField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["wallet", "kind", "period", "start"],
+                name="velocity_bucket_unique",
+            )
+        ]
+        indexes = [models.Index(fields=["start"], name="velocity_bucket_start_idx")]
+
+    def __str__(self):
+        return f"{self.kind} {self.period} {self.start:%Y-%m-%d %H:%M}: {self.amount}"
+
+    @staticmethod
+    def starts(now):
+        minute = now.replace(second=0, microsecond=0)
+        return minute, minute.replace(minute=0)
+
+    @classmethod
+    def record(cls, wallet_id, kind, amount, now=None, using=DEFAULT_DB_ALIAS):
+        minute, hour = cls.starts(now or timezone.now())
+        buckets = cls.objects.using(using)
+        for period, start in (("MINUTE", minute), ("HOUR", hour)):
+            lookup = {"wallet_id": wallet_id, "kind": kind, "period": period}
+            increment = {"amount": F("amount") + amount}
+            if buckets.filter(start=start, **lookup).update(**increment):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    buckets.create(start=start, amount=amount, **lookup)
+            except IntegrityError:
+                buckets.filter(start=start, **lookup).update(**increment)
+
+    @classmethod
+    def usage(cls, wallet_id, kind, now=None, using=DEFAULT_DB_ALIAS):
+        """
+        Totals for the last hour and the last day. The daily total includes
+        the whole oldest hour bucket, so it errs on the strict side.
+        """
+        minute, hour = cls.starts(now or timezone.now())
+        totals = (
+            cls.objects.using(using)
+            .filter(
+                Q(period="MINUTE", start__gt=minute - timedelta(hours=1))
+                | Q(period="HOUR", start__gt=hour - timedelta(hours=24)),
+                wallet_id=wallet_id,
+                kind=kind,
+            )
+            .aggregate(
+                hourly=Sum("amount", filter=Q(period="MINUTE")),
+                daily=Sum("amount", filter=Q(period="HOUR")),
+            )
+        )
+        return totals["hourly"] or Decimal("0"), totals["daily"] or Decimal("0")
+
 
 class Transfer(models.Model):
     sender = models.ForeignKey(
         Wallet, on_delete=models.CASCADE, related_name="sent_transfers"
     )
+    # Stored on the sender's shard; the receiver may live on another one.
     receiver = models.ForeignKey(
-        Wallet, on_delete=models.CASCADE, related_name="received_transfers"
+        Wallet,
+        on_delete=models.CASCADE,
+        related_name="received_transfers",
+        db_constraint=False,
     )
     amount = models.DecimalField(
         max_digits=12, decimal_places=2, validators=[MinValueValidator(0.01)]
@@ -100,6 +479,9 @@ class Transfer(models.Model):
     description = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["created_at"], name="transfer_created_idx")]
+
     def __str__(self):
         return f"Transfer of {self.amount} from {self.sender.user.email} to {self.receiver.user.email}"
 
@@ -108,24 +490,566 @@ class Transfer(models.Model):
             raise ValueError("Cannot transfer to yourself")
         if self.amount <= 0:
             raise ValueError("Transfer amount must be positive")
-        if self.sender.balance < self.amount:
+        if self.sender.available_balance < self.amount:
             raise ValueError("Insufficient funds")
 
-        with transaction.atomic():
-            self.sender.withdraw(self.amount)
-            self.receiver.deposit(self.amount)
-            super().save(*args, **kwargs)
+        db = db_for(self.sender)
+        kwargs["using"] = db
+        if db_for(self.receiver) != db:
+            return self.save_across_shards(*args, **kwargs)
 
-            Transaction.objects.create(
-                wallet=self.sender,
-                amount=-self.amount,
-                transaction_type="TRANSFER",
-                description=f"Transfer to {self.receiver.user.email}: {self.description or 'No description'}",
+        with span("transfer.save", amount=str(self.amount)), transaction.atomic(
+            using=db
+        ):
+            # The transfer legs below are what webhook subscribers are told about.
+            self.sender.withdraw(self.amount, webhook_event=None, limit_kind="TRANSFER")
+            self.receiver.deposit(self.amount, webhook_event=None)
+            with span("transfer.insert"):
+                super().save(*args, **kwargs)
+
+            with span("ledger.insert", rows=2):
+                sent = Transaction.objects.using(db).create(
+                    wallet=self.sender,
+                    amount=-self.amount,
+                    transaction_type="TRANSFER",
+                    transfer=self,
+                    counterparty=self.receiver,
+                    counterparty_email=self.receiver.user.email,
+                )
+
+                received = Transaction.objects.using(db).create(
+                    wallet=self.receiver,
+                    amount=self.amount,
+                    transaction_type="TRANSFER",
+                    transfer=self,
+                    counterparty=self.sender,
+                    counterparty_email=self.sender.user.email,
+                )
+            with span("webhook.enqueue"):
+                WebhookDelivery.enqueue(
+                    self.sender.user_id,
+                    "transfer.sent",
+                    sent,
+                    self.sender.balance,
+                    using=db,
+                )
+                WebhookDelivery.enqueue(
+                    self.receiver.user_id,
+                    "transfer.received",
+                    received,
+                    self.receiver.balance,
+                    using=db,
+                )
+            transaction.on_commit(
+                partial(publish_transaction, sent, self.sender.balance), using=db
+            )
+            transaction.on_commit(
+                partial(publish_transaction, received, self.receiver.balance),
+                using=db,
             )
 
-            Transaction.objects.create(
-                wallet=self.receiver,
-                amount=self.amount,
-                transaction_type="TRANSFER",
-                description=f"Transfer from {self.sender.user.email}: {self.description or 'No description'}",
+    def save_across_shards(self, *args, **kwargs):
+        """
+        Saga for wallets on different shards. The debit, the transfer row and
+        a TransferIntent commit together on the sender's shard; once they have
+        committed, the credit is applied on the receiver's shard by
+        TransferIntent.apply(). An interrupted credit is retried by the
+        resume_transfer_intents command.
+        """
+        db = kwargs["using"]
+        memo = self.description or "No description"
+        with span(
+            "transfer.save", amount=str(self.amount), shards=2
+        ), transaction.atomic(using=db):
+            self.sender.withdraw(self.amount, webhook_event=None, limit_kind="TRANSFER")
+            with span("transfer.insert"):
+                super().save(*args, **kwargs)
+            with span("ledger.insert"):
+                # Ledger text is stored because the counterparty's user row
+                # cannot be joined across shards.
+                sent = Transaction.objects.using(db).create(
+                    wallet=self.sender,
+                    amount=-self.amount,
+                    transaction_type="TRANSFER",
+                    transfer=self,
+                    counterparty=self.receiver,
+                    counterparty_email=self.receiver.user.email,
+                    description=f"Transfer to {self.receiver.user.email}: {memo}",
+                )
+                intent = TransferIntent.objects.using(db).create(
+                    transfer=self,
+                    sender=self.sender,
+                    receiver=self.receiver,
+                    amount=self.amount,
+                    description=f"Transfer from {self.sender.user.email}: {memo}",
+                )
+            with span("webhook.enqueue"):
+                WebhookDelivery.enqueue(
+                    self.sender.user_id,
+                    "transfer.sent",
+                    sent,
+                    self.sender.balance,
+                    using=db,
+                )
+            transaction.on_commit(
+                partial(publish_transaction, sent, self.sender.balance), using=db
+            )
+            # Deferred so the credit never commits before the debit, even when
+            # the caller wraps the transfer in its own transaction. A failure
+            # leaves the intent DEBITED for resume_transfer_intents. Not a
+            # partial: Django logs a robust callback's __qualname__.
+            receiver = self.receiver
+            transaction.on_commit(lambda: intent.apply(receiver), using=db, robust=True)
+
+
+class TransferIntent(models.Model):
+    """
+    Progress of a transfer between wallets on different shards, kept on the
+    sender's shard. Applying the credit writes a copy of the intent on the
+    receiver's shard in the same transaction; the shared primary key makes
+    the credit happen at most once however often it is retried.
+    """
+
+    STATUS_CHOICES = [
+        ("DEBITED", "Debited"),
+        ("CREDITED", "Credited"),
+        ("COMPLETED", "Completed"),
+        ("REVERSED", "Reversed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    transfer = models.ForeignKey(
+        Transfer, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    sender = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="+", db_constraint=False
+    )
+    receiver = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="+", db_constraint=False
+    )
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    # Ledger text for the receiver's leg.
+    description = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="DEBITED")
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "updated_at"], name="transfer_intent_status_idx"
             )
+        ]
+
+    def __str__(self):
+        return f"Intent {self.pk} ({self.status})"
+
+    def apply(self, receiver=None):
+        """
+        Credits the receiver and marks the intent completed. A credit that is
+        refused (e.g. the wallet is gone) reverses the debit instead. Database
+        errors propagate and leave the intent DEBITED for a later retry.
+        """
+        if receiver is None:
+            receiver = Wallet.objects.for_wallet(self.receiver_id).first()
+        if receiver is None:
+            return self.reverse("Receiver wallet not found")
+
+        db = db_for(receiver)
+        try:
+            with span("transfer.credit", shard=db), transaction.atomic(using=db):
+                try:
+                    with transaction.atomic(using=db):
+                        TransferIntent.objects.using(db).create(
+                            id=self.pk,
+                            sender_id=self.sender_id,
+                            receiver_id=self.receiver_id,
+                            amount=self.amount,
+                            description=self.description,
+                            status="CREDITED",
+                        )
+                except IntegrityError:
+                    pass  # Credited by an earlier attempt.
+                else:
+                    receiver.deposit(self.amount, webhook_event=None)
+                    received = Transaction.objects.using(db).create(
+                        wallet=receiver,
+                        amount=self.amount,
+                        transaction_type="TRANSFER",
+                        counterparty_id=self.sender_id,
+                        description=self.description,
+                    )
+                    WebhookDelivery.enqueue(
+                        receiver.user_id,
+                        "transfer.received",
+                        received,
+                        receiver.balance,
+                        using=db,
+                    )
+                    transaction.on_commit(
+                        partial(publish_transaction, received, receiver.balance),
+                        using=db,
+                    )
+        except ValueError as e:
+            return self.reverse(str(e))
+
+        TransferIntent.objects.using(db_for(self)).filter(pk=self.pk).update(
+            status="COMPLETED", attempts=F("attempts") + 1, updated_at=timezone.now()
+        )
+        self.status = "COMPLETED"
+
+    def reverse(self, error):
+        """Gives the sender their money back, once."""
+        db = db_for(self)
+        with span("transfer.reverse"), transaction.atomic(using=db):
+            if (
+                not TransferIntent.objects.using(db)
+                .filter(pk=self.pk, status="DEBITED")
+                .update(status="REVERSED", last_error=error, updated_at=timezone.now())
+            ):
+                return
+            sender = Wallet.objects.for_wallet(self.sender_id).select_for_update().get()
+            sender.deposit(self.amount, webhook_event="transfer.reversed")
+        self.status = "REVERSED"
+
+
+class Hold(models.Model):
+    """
+    Funds reserved on a wallet until they are captured, voided or expire.
+    Authorizing only raises ``Wallet.held_balance`` with a conditional UPDATE,
+    so no wallet row stays locked while the caller waits on a card network;
+    the ledger is written once, on capture. The hold counts against the
+    withdrawal limits from authorization on, and whatever is not captured is
+    given back to the buckets it was counted in.
+    """
+
+    STATUS_CHOICES = [
+        ("AUTHORIZED", "Authorized"),
+        ("CAPTURED", "Captured"),
+        ("VOIDED", "Voided"),
+        ("EXPIRED", "Expired"),
+    ]
+
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name="holds")
+    amount = models.DecimalField(
+        max_digits=12, decimal_places=2, validators=[MinValueValidator(0.01)]
+    )
+    captured_amount = models.DecimalField(
+        max_digits=12, decimal_places=2, blank=True, null=True
+    )
+    description = models.TextField(blank=True, default="")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default="AUTHORIZED"
+    )
+    expires_at = models.DateTimeField()
+    closed_at = models.DateTimeField(blank=True, null=True)
+    # Set by authorize() to the time its amount was counted, so the velocity
+    # buckets it went into can be found again when the hold is released.
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # The expire_holds sweeper's scan.
+            models.Index(
+                fields=["status", "expires_at"], name="hold_status_expires_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"Hold of {self.amount} on wallet {self.wallet_id} ({self.status})"
+
+    @classmethod
+    def authorize(cls, wallet, amount, description="", expires_at=None):
+        if amount <= 0:
+            raise ValueError("Hold amount must be positive")
+        db = db_for(wallet)
+        now = timezone.now()
+        with span("hold.authorize", wallet_id=wallet.pk), transaction.atomic(using=db):
+            # Counted like a withdrawal, so concurrent holds and withdrawals
+            # are checked one after the other.
+            with span("velocity.check", kind="WITHDRAWAL"):
+                VelocityBucket.record(wallet.pk, "WITHDRAWAL", amount, now, using=db)
+                wallet.check_velocity("WITHDRAWAL", 0)
+            if not (
+                Wallet.objects.using(db)
+                .filter(pk=wallet.pk, balance__gte=F("held_balance") + amount)
+                .update(held_balance=F("held_balance") + amount, updated_at=now)
+            ):
+                raise ValueError("Insufficient funds")
+            return cls.objects.using(db).create(
+                wallet=wallet,
+                amount=amount,
+                description=description,
+                expires_at=expires_at
+                or now + timedelta(seconds=settings.HOLDS["DEFAULT_TTL"]),
+                created_at=now,
+            )
+
+    def release_velocity(self, amount, using):
+        """Takes ``amount`` of this hold back out of its withdrawal buckets."""
+        if amount:
+            VelocityBucket.record(
+                self.wallet_id, "WITHDRAWAL", -amount, self.created_at, using=using
+            )
+
+    def close(self, status, now, **fields):
+        """Moves an authorized hold to ``status``; raises ValueError otherwise."""
+        filters = {"pk": self.pk, "status": "AUTHORIZED"}
+        if status == "CAPTURED":
+            filters["expires_at__gt"] = now
+        if not (
+            Hold.objects.using(db_for(self))
+            .filter(**filters)
+            .update(status=status, closed_at=now, **fields)
+        ):
+            raise ValueError("Hold is no longer authorized")
+        self.status, self.closed_at = status, now
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def capture(self, amount=None):
+        """Settles ``amount`` (the whole hold by default) and releases the rest."""
+        amount = self.amount if amount is None else amount
+        if amount <= 0 or amount > self.amount:
+            raise ValueError("Capture amount must be positive and at most the hold")
+        db = db_for(self)
+        now = timezone.now()
+        with span("hold.capture", hold_id=self.pk), transaction.atomic(using=db):
+            self.close("CAPTURED", now, captured_amount=amount)
+            # Buckets before the wallet row, in the same order as withdraw().
+            self.release_velocity(self.amount - amount, using=db)
+            Wallet.objects.using(db).filter(pk=self.wallet_id).update(
+                balance=F("balance") - amount,
+                held_balance=F("held_balance") - self.amount,
+                updated_at=now,
+            )
+            with span("ledger.insert"):
+                entry = Transaction.objects.using(db).create(
+                    wallet_id=self.wallet_id,
+                    amount=amount,
+                    transaction_type="WITHDRAWAL",
+                )
+            wallet = (
+                Wallet.objects.using(db)
+                .values("user_id", "balance")
+                .get(pk=self.wallet_id)
+            )
+            WebhookDelivery.enqueue(
+                wallet["user_id"],
+                "withdrawal.created",
+                entry,
+                wallet["balance"],
+                using=db,
+            )
+        transaction.on_commit(
+            partial(publish_transaction, entry, wallet["balance"]), using=db
+        )
+        return entry
+
+    def void(self):
+        db = db_for(self)
+        now = timezone.now()
+        with span("hold.void", hold_id=self.pk), transaction.atomic(using=db):
+            self.close("VOIDED", now)
+            self.release_velocity(self.amount, using=db)
+            Wallet.objects.using(db).filter(pk=self.wallet_id).update(
+                held_balance=F("held_balance") - self.amount, updated_at=now
+            )
+
+
+class ScheduledTransfer(models.Model):
+    sender = models.ForeignKey(
+        Wallet, on_delete=models.CASCADE, related_name="scheduled_transfers"
+    )
+    # Stored on the sender's shard; the receiver may live on another one.
+    receiver = models.ForeignKey(
+        Wallet,
+        on_delete=models.CASCADE,
+        related_name="incoming_scheduled_transfers",
+        db_constraint=False,
+    )
+    amount = models.DecimalField(
+        max_digits=12, decimal_places=2, validators=[MinValueValidator(0.01)]
+    )
+    description = models.TextField(blank=True, null=True)
+    cron = models.CharField(max_length=100, blank=True)
+    interval = models.DurationField(blank=True, null=True)
+    next_run_at = models.DateTimeField()
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    run_count = models.PositiveIntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_run_at"],
+                condition=Q(is_active=True),
+                name="scheduled_transfer_due_idx",
+            )
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(cron="", interval__isnull=False)
+                | (~Q(cron="") & Q(interval__isnull=True)),
+                name="scheduled_transfer_cron_or_interval",
+            )
+        ]
+
+    def __str__(self):
+        return f"Scheduled transfer of {self.amount} from {self.sender.user.email} to {self.receiver.user.email}"
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            kwargs["using"] = shard_for_wallet(self.sender_id)
+        super().save(*args, **kwargs)
+
+    def compute_next_run(self, after):
+        if self.interval:
+            next_run = self.next_run_at + self.interval
+            # Missed periods are skipped instead of being paid all at once.
+            return next_run if next_run > after else after + self.interval
+        return CronSchedule(self.cron).next_after(after)
+
+    def execute(self):
+        """
+        Runs one transfer inside the caller's transaction on the sender's
+        shard. Wallets on that shard are locked in primary key order so
+        concurrent workers never deadlock; a receiver on another shard is
+        credited by the Transfer saga once the debit commits.
+        """
+        db = shard_for_wallet(self.sender_id)
+        locked = {
+            wallet.pk: wallet
+            for wallet in Wallet.objects.using(db)
+            .select_for_update(of=("self",))
+            .select_related("user")
+            .filter(pk__in=[self.sender_id, self.receiver_id])
+            .order_by("pk")
+        }
+        receiver = locked.get(self.receiver_id)
+        if receiver is None:
+            receiver = (
+                Wallet.objects.for_wallet(self.receiver_id).select_related("user").get()
+            )
+        return Transfer.objects.create(
+            sender=locked[self.sender_id],
+            receiver=receiver,
+            amount=self.amount,
+            description=self.description,
+        )
+
+
+class SettlementFile(models.Model):
+    """A partner bank settlement file; its checksum makes each import run once."""
+
+    name = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64, unique=True)
+    row_count = models.PositiveIntegerField(default=0)
+    applied_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Settlement {self.name} ({self.row_count} rows)"
+
+
+class SettlementEntry(models.Model):
+    """
+    Staging row for a settlement file. Rows whose CPF has no wallet stay here
+    with ``wallet`` unset for review; applied rows are removed.
+    """
+
+    file = models.ForeignKey(
+        SettlementFile, on_delete=models.CASCADE, related_name="entries"
+    )
+    line = models.PositiveIntegerField()
+    cpf = models.CharField(max_length=11)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    reference = models.CharField(max_length=100, blank=True, default="")
+    wallet = models.ForeignKey(
+        Wallet, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+
+    def __str__(self):
+        return f"Line {self.line} of {self.file.name}"
+
+
+def generate_webhook_secret():
+    return secrets.token_hex(32)
+
+
+class WebhookSubscription(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="webhook_subscriptions"
+    )
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=64, default=generate_webhook_secret)
+    is_active = models.BooleanField(default=True)
+    # Circuit breaker state, maintained by the dispatch_webhooks worker.
+    consecutive_failures = models.PositiveIntegerField(default=0)
+    circuit_open_until = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Webhook {self.url} for {self.user.email}"
+
+
+class WebhookDelivery(models.Model):
+    """
+    Outbox row written in the same database transaction as the ledger change
+    it reports, then sent by the dispatch_webhooks worker.
+    """
+
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("DELIVERED", "Delivered"),
+        ("FAILED", "Failed"),
+    ]
+
+    subscription = models.ForeignKey(
+        WebhookSubscription, on_delete=models.CASCADE, related_name="deliveries"
+    )
+    event = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_status_code = models.PositiveIntegerField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["next_attempt_at"],
+                condition=Q(status="PENDING"),
+                name="webhook_delivery_due_idx",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.event} to {self.subscription.url} ({self.status})"
+
+    @classmethod
+    def enqueue(cls, user_id, event, entry, balance, using=DEFAULT_DB_ALIAS):
+        if using != DEFAULT_DB_ALIAS:
+            # The outbox lives on the default database. Writes from a shard
+            # wait for that shard's commit, so a crash in between loses the
+            # webhook rather than announcing a change that was rolled back.
+            transaction.on_commit(
+                partial(cls.enqueue, user_id, event, entry, balance), using=using
+            )
+            return
+        subscriptions = WebhookSubscription.objects.filter(
+            user_id=user_id, is_active=True
+        ).values_list("pk", flat=True)
+        payload = {"event": event, **transaction_payload(entry, balance)}
+        cls.objects.bulk_create(
+            cls(subscription_id=pk, event=event, payload=payload)
+            for pk in subscriptions
+        )
@@ -0,0 +1,48 @@
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import LimitOffsetPagination
+
+
+class TransactionSearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists over very large tables. On PostgreSQL,
+    counts above ``exact_threshold`` come from the planner instead of
+    ``COUNT(*)``: ``pg_class.reltuples`` for the whole table and the EXPLAIN
+    row estimate for filtered lists. Smaller results are counted exactly.
+    """
+
+    exact_threshold = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return super().count
+        estimate = self.estimate(queryset, connection)
+        if estimate < self.exact_threshold:
+            return super().count
+        return estimate
+
+    def estimate(self, queryset, connection):
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                # -1 until the table has been vacuumed or analyzed.
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                return cursor.fetchone()[0]
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+            plan = cursor.fetchone()[0]
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,175 @@
+import cProfile
+import json
+import marshal
+import pstats
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+# cProfile cannot run two profilers at once in the same interpreter.
+_profiler_lock = threading.Lock()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that times every query and notes where it came from."""
+
+    def __init__(self):
+        self.queries = []
+        self.base_dir = str(settings.BASE_DIR)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(
+                {
+                    "sql": sql,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "many": many,
+                    "alias": context["connection"].alias,
+                    "origin": self.origin(),
+                }
+            )
+
+    def origin(self, depth=3):
+        frames = [
+            f"{Path(frame.filename).relative_to(self.base_dir)}:{frame.lineno} in {frame.name}"
+            for frame in traceback.extract_stack()
+            if frame.filename.startswith(self.base_dir)
+            and "site-packages" not in frame.filename
+            and frame.filename != __file__
+        ]
+        return frames[-depth:]
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a single request when staff ask for it with the ``X-Profile``
+    header or the ``_profile`` query parameter, set to ``json`` (report in the
+    response), ``pstats`` (a file for pstats, snakeviz or flameprof) or
+    ``store`` (normal response, report saved to ``PROFILING["STORE_DIR"]``).
+
+    Other requests only pay for a header and query string lookup. Sync
+    (WSGI) requests only; async requests pass through.
+    """
+
+    sync_capable = True
+    async_capable = True
+    formats = {"1", "json", "pstats", "store"}
+
+    def __init__(self, get_response):
+        config = settings.PROFILING
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.meta_key = "HTTP_" + config["HEADER"].upper().replace("-", "_")
+        self.param = config["QUERY_PARAM"]
+        self.store_dir = config["STORE_DIR"]
+        self.top = config["TOP"]
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+        mode = self.requested_mode(request)
+        if mode is None or not self.is_staff(request):
+            return self.get_response(request)
+        return self.profile(request, mode)
+
+    def requested_mode(self, request):
+        mode = request.META.get(self.meta_key)
+        if mode is None and self.param + "=" in request.META.get("QUERY_STRING", ""):
+            mode = request.GET.get(self.param)
+        return mode if mode in self.formats else None
+
+    def is_staff(self, request):
+        try:
+            authenticated = JWTAuthentication().authenticate(request)
+        except APIException:
+            return False
+        return authenticated is not None and authenticated[0].is_staff
+
+    def profile(self, request, mode):
+        recorder = QueryRecorder()
+        profiler = cProfile.Profile()
+        if not _profiler_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                started = time.perf_counter()
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+                elapsed = time.perf_counter() - started
+        finally:
+            _profiler_lock.release()
+
+        stats = pstats.Stats(profiler)
+        report = self.build_report(request, response, elapsed, stats, recorder)
+        if mode == "pstats":
+            return HttpResponse(
+                marshal.dumps(stats.stats),
+                content_type="application/octet-stream",
+                headers={"Content-Disposition": 'attachment; filename="request.prof"'},
+            )
+        if mode == "store" and self.store_dir:
+            response["X-Profile-Report"] = self.store(report, stats)
+            return response
+        return JsonResponse(report)
+
+    def build_report(self, request, response, elapsed, stats, recorder):
+        stats.sort_stats("cumulative")
+        functions = []
+        for func in stats.fcn_list[: self.top]:
+            _, calls, total, cumulative, _ = stats.stats[func]
+            filename, line, name = func
+            functions.append(
+                {
+                    "function": f"{filename}:{line}({name})",
+                    "calls": calls,
+                    "total_ms": round(total * 1000, 3),
+                    "cumulative_ms": round(cumulative * 1000, 3),
+                }
+            )
+        return {
+            "method": request.method,
+            "path": request.get_full_path(),
+            "status": response.status_code,
+            "duration_ms": round(elapsed * 1000, 3),
+            "sql": {
+                "count": len(recorder.queries),
+                "total_ms": round(sum(q["duration_ms"] for q in recorder.queries), 3),
+                "queries": recorder.queries,
+            },
+            "functions": functions,
+        }
+
+    def store(self, report, stats):
+        directory = Path(self.store_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        name = "{}-{}-{}".format(
+            timezone.now().strftime("%Y%m%dT%H%M%S%f"),
+            report["method"],
+            report["path"].split("?")[0].strip("/").replace("/", "_") or "root",
+        )
+        (directory / f"{name}.json").write_text(json.dumps(report, indent=2))
+        (directory / f"{name}.prof").write_bytes(marshal.dumps(stats.stats))
+        return name
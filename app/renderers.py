@@ -0,0 +1,43 @@
+from rest_framework.utils import encoders
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson when it is installed.
+
+    Decimal and lazy strings go through DRF's encoder, datetimes are encoded
+    natively. Anything orjson cannot handle (custom indents, integers wider
+    than 64 bits) falls back to the stock renderer.
+    """
+
+    options = (orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS) if orjson else 0
+    default = encoders.JSONEncoder().default
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        options = self.options
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None:
+            if indent != 2:
+                return super().render(data, accepted_media_type, renderer_context)
+            options |= orjson.OPT_INDENT_2
+
+        try:
+            ret = orjson.dumps(data, default=self.default, option=options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same escaping as JSONRenderer so the output stays a strict JS subset.
+        if b"\xe2\x80\xa8" in ret or b"\xe2\x80\xa9" in ret:
+            ret = ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(
+                b"\xe2\x80\xa9", b"\\u2029"
+            )
+        return ret
@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+
+class CronSchedule:
+    """
+    Standard five-field cron expression: minute, hour, day of month, month
+    and day of week (0-7, Sunday is 0 or 7). Supports ``*``, lists, ranges
+    and steps, e.g. ``"0 9 1 * *"`` or ``"*/15 8-18 * * 1-5"``.
+    """
+
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("Cron expression must have 5 fields")
+        self.expression = expression
+        fields = [
+            self.parse_field(part, *bounds) for part, bounds in zip(parts, self.BOUNDS)
+        ]
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {day % 7 for day in weekdays}
+        self.any_day = parts[2] == "*"
+        self.any_weekday = parts[4] == "*"
+
+    def parse_field(self, field, low, high):
+        values = set()
+        for item in field.split(","):
+            base, _, step = item.partition("/")
+            if base == "*":
+                start, end = low, high
+            elif "-" in base:
+                start, end = (int(value) for value in base.split("-", 1))
+            else:
+                start = end = int(base)
+            if step:
+                if not step.isdigit() or int(step) == 0:
+                    raise ValueError(f"Invalid step in cron field: {item}")
+                if base != "*" and "-" not in base:
+                    end = high
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field out of range: {item}")
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def day_matches(self, dt):
+        day = dt.day in self.days
+        weekday = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, after):
+        dt = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                month = dt.month % 12 + 1
+                dt = dt.replace(
+                    year=dt.year + (month == 1), month=month, day=1, hour=0, minute=0
+                )
+            elif not self.day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt
+        raise ValueError(f"Cron expression never matches: {self.expression}")
@@ -1,8 +1,28 @@
+from datetime import timedelta
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from rest_framework import serializers
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.validators import validate_email
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
-from .models import Transaction, Transfer, Wallet
+from .aliases import resolve_wallet
+from .models import (
+    Hold,
+    ScheduledTransfer,
+    Transaction,
+    Transfer,
+    Wallet,
+    WebhookSubscription,
+)
+from .schedules import CronSchedule
+from .webhooks import BlockedAddressError, check_url
 
 User = get_user_model()
 
@@ -34,27 +54,118 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+def _available_balance(balance, held_balance):
+    return f"{balance - held_balance:f}"
+
+
 class WalletSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source="user.email", read_only=True)
+    # ``balance`` is the ledger balance; holds are only subtracted here.
+    available_balance = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True
+    )
+
+    row_methods = {
+        "available_balance": (["balance", "held_balance"], _available_balance),
+    }
 
     class Meta:
         model = Wallet
-        fields = ["id", "user_email", "balance", "created_at", "updated_at"]
-        read_only_fields = ["id", "user_email", "created_at", "updated_at"]
+        fields = [
+            "id",
+            "user_email",
+            "balance",
+            "held_balance",
+            "available_balance",
+            "created_at",
+            "updated_at",
+        ]
+        read_only_fields = [
+            "id",
+            "user_email",
+            "held_balance",
+            "created_at",
+            "updated_at",
+        ]
 
 
 class TransactionSerializer(serializers.ModelSerializer):
+    description = serializers.SerializerMethodField()
+
+    # How RowSerializer renders method fields from values() rows.
+    row_methods = {
+        "description": (Transaction.DESCRIPTION_FIELDS, Transaction.describe),
+    }
+
     class Meta:
         model = Transaction
         fields = ["id", "amount", "transaction_type", "description", "created_at"]
         read_only_fields = fields
 
+    def get_description(self, obj):
+        return obj.get_description()
+
+
+class WalletField(serializers.PrimaryKeyRelatedField):
+    """Primary key field that reads the wallet from the shard its id maps to."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        try:
+            return (
+                self.get_queryset().for_wallet(int(data)).select_related("user").get()
+            )
+        except Wallet.DoesNotExist:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class WalletAliasField(serializers.Field):
+    """
+    Wallet addressed by its owner's email or CPF. Writes resolve the alias
+    through app.aliases; reads render the owner's alias.
+    """
+
+    default_error_messages = {
+        "invalid": "Enter a valid {alias}.",
+        "does_not_exist": "No wallet found for this {alias}.",
+    }
+
+    def __init__(self, alias, **kwargs):
+        self.alias = alias
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        value = str(data).strip()
+        if self.alias == "email":
+            try:
+                validate_email(value)
+            except ValidationError:
+                self.fail("invalid", alias=self.alias)
+        elif not (value.isdigit() and len(value) == 11):
+            self.fail("invalid", alias=self.alias)
+        wallet = resolve_wallet(self.alias, value)
+        if wallet is None:
+            self.fail("does_not_exist", alias=self.alias)
+        return wallet
+
+    def to_representation(self, value):
+        return getattr(value.user, self.alias)
+
 
 class TransferSerializer(serializers.ModelSerializer):
-    sender_email = serializers.EmailField(source="sender.user.email", read_only=True)
-    receiver_email = serializers.EmailField(
-        source="receiver.user.email", read_only=True
+    sender = WalletField(queryset=Wallet.objects.all(), write_only=True)
+    # The receiver is given by exactly one of these three fields.
+    receiver = WalletField(
+        queryset=Wallet.objects.all(), write_only=True, required=False
     )
+    receiver_email = WalletAliasField("email", source="receiver", required=False)
+    receiver_cpf = WalletAliasField(
+        "cpf", source="receiver", write_only=True, required=False
+    )
+    sender_email = serializers.EmailField(source="sender.user.email", read_only=True)
 
     class Meta:
         model = Transfer
@@ -64,22 +175,267 @@ class TransferSerializer(serializers.ModelSerializer):
             "sender_email",
             "receiver",
             "receiver_email",
+            "receiver_cpf",
             "amount",
             "description",
             "created_at",
         ]
-        extra_kwargs = {
-            "sender": {"write_only": True},
-            "receiver": {"write_only": True},
-        }
 
     def validate(self, data):
+        given = [
+            name
+            for name in ("receiver", "receiver_email", "receiver_cpf")
+            if self.initial_data.get(name) not in (None, "")
+        ]
+        if len(given) != 1:
+            raise serializers.ValidationError(
+                {
+                    "receiver": "Provide exactly one of receiver, receiver_email "
+                    "or receiver_cpf."
+                }
+            )
         if data["sender"] == data["receiver"]:
             raise serializers.ValidationError("Cannot transfer to yourself")
         if data["amount"] <= 0:
             raise serializers.ValidationError("Amount must be positive")
+        request = self.context.get("request")
+        if request is not None:
+            try:
+                wallet = data["sender"]
+                if wallet.user_id != request.user.pk:
+                    wallet = Wallet.objects.for_user(request.user).get()
+                wallet.check_velocity("TRANSFER", data["amount"])
+            except Wallet.DoesNotExist:
+                pass
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
         return data
 
 
+class HoldSerializer(serializers.ModelSerializer):
+    expires_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = Hold
+        fields = [
+            "id",
+            "amount",
+            "captured_amount",
+            "description",
+            "status",
+            "expires_at",
+            "closed_at",
+            "created_at",
+        ]
+        read_only_fields = [
+            "id",
+            "captured_amount",
+            "status",
+            "closed_at",
+            "created_at",
+        ]
+
+    def validate_expires_at(self, value):
+        if value <= timezone.now():
+            raise serializers.ValidationError("expires_at must be in the future")
+        return value
+
+
+class HoldCaptureSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(
+        max_digits=12, decimal_places=2, min_value=Decimal("0.01"), required=False
+    )
+
+
 class DepositSerializer(serializers.Serializer):
     amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0.01)
+
+
+class ScheduledTransferSerializer(serializers.ModelSerializer):
+    receiver = WalletField(queryset=Wallet.objects.all(), write_only=True)
+    receiver_email = serializers.EmailField(
+        source="receiver.user.email", read_only=True
+    )
+    next_run_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = ScheduledTransfer
+        fields = [
+            "id",
+            "receiver",
+            "receiver_email",
+            "amount",
+            "description",
+            "cron",
+            "interval",
+            "next_run_at",
+            "is_active",
+            "last_run_at",
+            "last_error",
+            "run_count",
+            "created_at",
+        ]
+        read_only_fields = [
+            "last_run_at",
+            "last_error",
+            "run_count",
+            "created_at",
+        ]
+
+    def validate(self, data):
+        if bool(data.get("cron")) == bool(data.get("interval")):
+            raise serializers.ValidationError("Provide either cron or interval")
+        if data.get("interval") and data["interval"] < timedelta(minutes=1):
+            raise serializers.ValidationError("Interval must be at least one minute")
+        if data.get("cron"):
+            try:
+                schedule = CronSchedule(data["cron"])
+                data.setdefault("next_run_at", schedule.next_after(timezone.now()))
+            except ValueError as e:
+                raise serializers.ValidationError({"cron": str(e)})
+        else:
+            data.setdefault("next_run_at", timezone.now() + data["interval"])
+        return data
+
+
+class WebhookSubscriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = WebhookSubscription
+        fields = [
+            "id",
+            "url",
+            "secret",
+            "is_active",
+            "consecutive_failures",
+            "circuit_open_until",
+            "created_at",
+        ]
+        read_only_fields = [
+            "secret",
+            "consecutive_failures",
+            "circuit_open_until",
+            "created_at",
+        ]
+
+    def validate_url(self, value):
+        if not settings.DEBUG and not value.startswith("https://"):
+            raise serializers.ValidationError("Webhook URL must use HTTPS")
+        try:
+            check_url(value)
+        except BlockedAddressError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+
+class RowSerializer:
+    """
+    Read-only fast path for a ModelSerializer.
+
+    Serializes the dicts returned by ``QuerySet.values(*row_serializer.fields)``
+    with plain functions compiled once from the serializer's fields, producing
+    the same output as ``serializer_class(instance).data``.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def compiled(self):
+        row_methods = getattr(self.serializer_class, "row_methods", {})
+        compiled = []
+        for name, field in self.serializer_class().fields.items():
+            if field.write_only:
+                continue
+            if name in row_methods:
+                keys, method = row_methods[name]
+                compiled.append((name, tuple(keys), method))
+            elif field.source == "*" or not field.source_attrs:
+                raise ImproperlyConfigured(
+                    f"{self.serializer_class.__name__}.{name} cannot be read from values()"
+                )
+            else:
+                compiled.append((name, "__".join(field.source_attrs), field))
+        return compiled
+
+    @property
+    def fields(self):
+        fields = []
+        for _, key, _ in self.compiled:
+            for column in key if isinstance(key, tuple) else (key,):
+                if column not in fields:
+                    fields.append(column)
+        return fields
+
+    def getters(self):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        getters = []
+        for name, key, field in self.compiled:
+            if isinstance(key, tuple):
+                getters.append((name, _method_getter(itemgetter(*key), field)))
+                continue
+            convert = self.compile_field(field, tz)
+            if convert is _identity:
+                getters.append((name, itemgetter(key)))
+            else:
+                getters.append((name, _field_getter(key, convert)))
+        return getters
+
+    def compile_field(self, field, tz):
+        if isinstance(field, serializers.DecimalField):
+            coerce = getattr(
+                field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+            )
+            if coerce and not field.localize and not field.normalize_output:
+                quantize = field.quantize
+                return lambda value: "{:f}".format(quantize(value))
+        elif isinstance(field, serializers.DateTimeField):
+            output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+            if output_format is not None and output_format.lower() == ISO_8601:
+                field_tz = getattr(field, "timezone", tz)
+                if field_tz is not None:
+                    return lambda value: _isoformat(value.astimezone(field_tz))
+        elif type(field) in _NATIVE_FIELDS:
+            return _identity
+        return field.to_representation
+
+    def serialize(self, row):
+        return self.serialize_many([row])[0]
+
+    def serialize_many(self, rows):
+        getters = self.getters()
+        return [{name: get(row) for name, get in getters} for row in rows]
+
+
+_NATIVE_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.EmailField,
+    serializers.ChoiceField,
+)
+
+
+def _identity(value):
+    return value
+
+
+def _field_getter(key, convert):
+    def get(row):
+        value = row[key]
+        return None if value is None else convert(value)
+
+    return get
+
+
+def _method_getter(values, method):
+    return lambda row: method(*values(row))
+
+
+def _isoformat(value):
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+wallet_rows = RowSerializer(WalletSerializer)
+transaction_rows = RowSerializer(TransactionSerializer)
@@ -0,0 +1,47 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+def is_sharded():
+    return len(settings.WALLET_SHARDS) > 1
+
+
+def shard_for_user(user_id):
+    """Database alias holding the wallet, ledger and transfers of ``user_id``."""
+    shards = settings.WALLET_SHARDS
+    return shards[int(user_id) % len(shards)]
+
+
+def shard_for_wallet(wallet_id):
+    # Sharded wallets take their owner's id as primary key (see Wallet.save).
+    return shard_for_user(wallet_id)
+
+
+def db_for(instance):
+    return instance._state.db or DEFAULT_DB_ALIAS
+
+
+class ShardRouter:
+    """
+    Keeps related lookups and saves on the database an instance came from;
+    everything else goes to ``default`` unless the caller picks a shard with
+    ``using()`` or the shard-aware managers (``Wallet.objects.for_user()``).
+
+    Every table exists on every database: users are copied to their home
+    shard so wallets keep a real foreign key to them, and rows that point to
+    a wallet on another shard are declared with ``db_constraint=False``.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -0,0 +1,40 @@
+import copy
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .aliases import get_alias_cache
+from .models import User
+from .sharding import is_sharded, shard_for_user
+
+
+@receiver(post_save, sender=User)
+def replicate_user_to_shard(sender, instance, raw, using, **kwargs):
+    """
+    Copies users to the shard that holds their wallet, so wallets keep a real
+    foreign key and ledger queries can join the owner's email locally.
+    """
+    if raw or not is_sharded():
+        return
+    shard = shard_for_user(instance.pk)
+    if using == shard:
+        return
+    replica = copy.copy(instance)
+    # Limit tiers only exist on the default database.
+    replica.limit_tier = None
+    replica.save(using=shard)
+
+
+@receiver(post_delete, sender=User)
+def delete_user_from_shard(sender, instance, using, **kwargs):
+    if not is_sharded():
+        return
+    shard = shard_for_user(instance.pk)
+    if using != shard:
+        User.objects.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_aliases(sender, instance, **kwargs):
+    get_alias_cache().invalidate_user(instance.pk)
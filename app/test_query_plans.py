@@ -0,0 +1,170 @@
+"""
+Query-plan regression tests for the hot API queries.
+
+They seed a realistic ledger, run the requests and EXPLAIN every SELECT they
+issued. PostgreSQL only, e.g. against the docker-compose database:
+
+    python manage.py test app.test_query_plans
+
+Plans are written as JSON to ``QUERY_PLAN_DIR`` (default ``query_plans/``).
+"""
+
+import json
+import os
+from decimal import Decimal
+from pathlib import Path
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient, APITestCase
+
+from app.models import Transaction, User, Wallet
+
+PLAN_DIR = Path(os.getenv("QUERY_PLAN_DIR", settings.BASE_DIR / "query_plans"))
+USERS = int(os.getenv("QUERY_PLAN_USERS", "2000"))
+ROWS_PER_WALLET = int(os.getenv("QUERY_PLAN_ROWS_PER_WALLET", "50"))
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans need PostgreSQL")
+class QueryPlanTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(
+                email=f"plan{i}@test.com",
+                username=f"plan{i}",
+                cpf=f"{i:011d}",
+                password="!",
+            )
+            for i in range(USERS)
+        )
+        wallets = Wallet.objects.bulk_create(
+            Wallet(user=user, balance=Decimal("1000.00")) for user in users
+        )
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    wallet=wallet,
+                    amount=Decimal("1.00"),
+                    transaction_type="DEPOSIT",
+                )
+                for wallet in wallets
+                for _ in range(ROWS_PER_WALLET)
+            ),
+            batch_size=10_000,
+        )
+        with connection.cursor() as cursor:
+            # Spread the ledger over 90 days, then refresh planner statistics.
+            cursor.execute(
+                "UPDATE app_transaction SET created_at = "
+                "now() - (id % 2160) * interval '1 hour'"
+            )
+            cursor.execute("ANALYZE app_user, app_wallet, app_transaction")
+
+        cls.user, cls.receiver = users[USERS // 2], users[USERS // 2 + 1]
+        cls.wallet, cls.receiver_wallet = wallets[USERS // 2], wallets[USERS // 2 + 1]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def explain_requests(self, name, send):
+        """Runs ``send()`` and returns the plan nodes of every SELECT it issued."""
+        with CaptureQueriesContext(connection) as queries:
+            response = send()
+        self.assertLess(response.status_code, 400, response.data)
+
+        nodes, plans = [], []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query["sql"].lstrip().upper().startswith("SELECT"):
+                    continue
+                cursor.execute("EXPLAIN (FORMAT JSON) " + query["sql"])
+                plan = cursor.fetchone()[0]
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                plans.append({"sql": query["sql"], "plan": plan})
+                nodes.extend(plan_nodes(plan[0]["Plan"]))
+
+        PLAN_DIR.mkdir(parents=True, exist_ok=True)
+        (PLAN_DIR / f"{name}.json").write_text(json.dumps(plans, indent=2))
+        return nodes
+
+    def assertNoSeqScan(self, nodes, table="app_transaction"):
+        scans = [
+            node
+            for node in nodes
+            if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == table
+        ]
+        self.assertEqual(scans, [], f"Sequential scan on {table}")
+
+    def assertUsesIndex(self, nodes, index):
+        self.assertIn(index, {node.get("Index Name") for node in nodes})
+
+    def test_wallet_lookup_by_user(self):
+        nodes = self.explain_requests(
+            "wallet_detail", lambda: self.client.get(reverse("wallet-detail"))
+        )
+        self.assertNoSeqScan(nodes, "app_wallet")
+
+    def test_history(self):
+        nodes = self.explain_requests(
+            "history", lambda: self.client.get(reverse("transaction-list"))
+        )
+        self.assertNoSeqScan(nodes)
+        self.assertUsesIndex(nodes, "transaction_wallet_id_idx")
+        self.assertUsesIndex(nodes, "transaction_wallet_created_idx")
+
+    def test_history_with_date_filters(self):
+        today = Transaction.objects.latest("created_at").created_at.date()
+        params = {"start_date": f"{today.replace(day=1)}", "end_date": f"{today}"}
+        nodes = self.explain_requests(
+            "history_date_range",
+            lambda: self.client.get(reverse("transaction-list"), params),
+        )
+        self.assertNoSeqScan(nodes)
+        self.assertUsesIndex(nodes, "transaction_wallet_created_idx")
+
+    def test_history_delta_sync(self):
+        since_id = self.wallet.transactions.order_by("-id").values("id")[10]["id"]
+        nodes = self.explain_requests(
+            "history_since_id",
+            lambda: self.client.get(
+                reverse("transaction-list"), {"since_id": since_id}
+            ),
+        )
+        self.assertNoSeqScan(nodes)
+
+    def test_history_search_by_email(self):
+        nodes = self.explain_requests(
+            "history_search",
+            lambda: self.client.get(
+                reverse("transaction-list"), {"q": self.receiver.email}
+            ),
+        )
+        self.assertNoSeqScan(nodes)
+        self.assertUsesIndex(nodes, "user_email_trgm")
+
+    def test_transfer_creation(self):
+        nodes = self.explain_requests(
+            "transfer_create",
+            lambda: self.client.post(
+                reverse("transfer-create"),
+                {
+                    "sender": self.wallet.pk,
+                    "receiver": self.receiver_wallet.pk,
+                    "amount": "10.00",
+                },
+                format="json",
+            ),
+        )
+        self.assertNoSeqScan(nodes)
+        self.assertNoSeqScan(nodes, "app_wallet")
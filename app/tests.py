@@ -1,11 +1,67 @@
+import asyncio
+import json
+import marshal
+import threading
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
 from decimal import Decimal
+import os
+import socket
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from app.models import Wallet
+from app.models import (
+    Hold,
+    LimitTier,
+    ScheduledTransfer,
+    SettlementFile,
+    Transaction,
+    Transfer,
+    TransferIntent,
+    VelocityBucket,
+    Wallet,
+    WebhookDelivery,
+    WebhookSubscription,
+)
+from app.aliases import AliasCache, get_alias_cache
+from app.events import get_broker
+from app.management.commands.dispatch_webhooks import Command as DispatchWebhooks
+from app.management.commands.run_scheduled_transfers import (
+    Command as RunScheduledTransfers,
+)
+from app.pagination import EstimatedCountPaginator
+from app.renderers import ORJSONRenderer
+from app.schedules import CronSchedule
+from app.sharding import shard_for_user
+from app.serializers import (
+    TransactionSerializer,
+    WalletSerializer,
+    transaction_rows,
+    wallet_rows,
+)
+from app.throttling import (
+    LocalMemoryBucketStore,
+    get_bucket_store,
+    get_load_shedder,
+)
+from app.tracing import FileSink, get_sink, start_trace, to_otlp
+from app.webhooks import sign
 
 User = get_user_model()
 
@@ -201,3 +257,1458 @@ class TransactionHistoryTests(APITestCase):
         response = self.client.get(url, {"start_date": today})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 2)
+
+
+class JSONRenderingTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="render@test.com",
+            username="rendertest",
+            cpf="32132132132",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("10.00"))
+        self.wallet.deposit(Decimal("0.10"))
+
+        response = self.client.post(
+            reverse("login"),
+            {"email": "render@test.com", "password": "testpass123"},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_renderer_matches_drf_json_renderer(self):
+        data = {
+            "amount": Decimal("12.50"),
+            "serialized": TransactionSerializer(
+                self.wallet.transactions.all(), many=True
+            ).data,
+            "text": "line\u2028separator",
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_history_is_rendered_as_json(self):
+        response = self.client.get(reverse("transaction-list"))
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.json()[0]["amount"], "0.10")
+
+    def test_malformed_json_is_rejected(self):
+        response = self.client.post(
+            reverse("wallet-deposit"), "{bad json", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RowSerializerTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="rows@test.com",
+            username="rowstest",
+            cpf="45645645645",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("99.99"))
+        self.wallet.deposit(Decimal("0.01"))
+        self.wallet.deposit(Decimal("1234.5"))
+        self.wallet.withdraw(Decimal("10"))
+
+        response = self.client.post(
+            reverse("login"),
+            {"email": "rows@test.com", "password": "testpass123"},
+            format="json",
+        )
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+
+    def test_transaction_rows_match_serializer(self):
+        queryset = self.wallet.transactions.order_by("-created_at")
+        expected = JSONRenderer().render(
+            TransactionSerializer(queryset, many=True).data
+        )
+        fast = JSONRenderer().render(
+            transaction_rows.serialize_many(queryset.values(*transaction_rows.fields))
+        )
+        self.assertEqual(fast, expected)
+
+    def test_wallet_row_matches_serializer(self):
+        self.wallet.refresh_from_db()
+        expected = JSONRenderer().render(WalletSerializer(self.wallet).data)
+        row = Wallet.objects.values(*wallet_rows.fields).get(pk=self.wallet.pk)
+        self.assertEqual(JSONRenderer().render(wallet_rows.serialize(row)), expected)
+
+    def test_history_endpoint_matches_serializer(self):
+        response = self.client.get(reverse("transaction-list"))
+        queryset = self.wallet.transactions.order_by("-created_at")
+        expected = JSONRenderer().render(
+            TransactionSerializer(queryset, many=True).data
+        )
+        self.assertEqual(response.content, expected)
+
+
+@override_settings(
+    REST_FRAMEWORK={
+        **settings.REST_FRAMEWORK,
+        "DEFAULT_THROTTLE_RATES": {"deposit": "2/min", "deposit_ip": "100/min"},
+    }
+)
+class ThrottlingTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="throttle@test.com",
+            username="throttletest",
+            cpf="78978978978",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("0.00"))
+        self.client.force_authenticate(self.user)
+        get_bucket_store().clear()
+
+    def tearDown(self):
+        get_bucket_store().clear()
+
+    def deposit(self):
+        return self.client.post(
+            reverse("wallet-deposit"), {"amount": "1.00"}, format="json"
+        )
+
+    def test_deposits_are_throttled_per_user(self):
+        self.assertEqual(self.deposit().status_code, status.HTTP_200_OK)
+        self.assertEqual(self.deposit().status_code, status.HTTP_200_OK)
+        response = self.deposit()
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("2.00"))
+
+    @override_settings(THROTTLE_BUCKET_STORE="app.throttling.CacheBucketStore")
+    def test_cache_bucket_store(self):
+        get_bucket_store().clear()
+        self.deposit()
+        self.deposit()
+        self.assertEqual(self.deposit().status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_token_bucket_refills(self):
+        store = LocalMemoryBucketStore()
+        self.assertEqual(store.consume("k", 1, 1.0, now=0), (True, 0))
+        self.assertFalse(store.consume("k", 1, 1.0, now=0.5)[0])
+        self.assertTrue(store.consume("k", 1, 1.0, now=2)[0])
+
+    @override_settings(
+        LOAD_SHEDDING={"deposit": {"MAX_IN_FLIGHT": 0, "RETRY_AFTER": 5}}
+    )
+    def test_load_shedding(self):
+        response = self.deposit()
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "5")
+
+    @override_settings(LOAD_SHEDDING={"deposit": {"MAX_IN_FLIGHT": 1}})
+    def test_load_shedding_slot_is_released_on_server_errors(self):
+        shedder = get_load_shedder("deposit")
+        self.client.raise_request_exception = False
+        with mock.patch.object(Wallet, "deposit", side_effect=Exception("boom")):
+            for _ in range(2):
+                response = self.deposit()
+                self.assertEqual(response.status_code, 500)
+        self.assertEqual(shedder.in_flight, 0)
+
+
+class ScheduledTransferTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.sender = User.objects.create_user(
+            email="payer@test.com",
+            username="payertest",
+            cpf="10120230344",
+            password="testpass123",
+        )
+        self.sender_wallet = Wallet.objects.create(
+            user=self.sender, balance=Decimal("100.00")
+        )
+        self.receiver = User.objects.create_user(
+            email="landlord@test.com",
+            username="landlordtest",
+            cpf="40450560677",
+            password="testpass123",
+        )
+        self.receiver_wallet = Wallet.objects.create(user=self.receiver)
+        self.client.force_authenticate(self.sender)
+
+    def test_create_scheduled_transfer(self):
+        response = self.client.post(
+            reverse("scheduled-transfer-list"),
+            {
+                "receiver": self.receiver_wallet.id,
+                "amount": "30.00",
+                "description": "Rent",
+                "cron": "0 9 1 * *",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        next_run_at = ScheduledTransfer.objects.get().next_run_at
+        self.assertEqual((next_run_at.day, next_run_at.hour), (1, 9))
+
+    def test_invalid_cron_is_rejected(self):
+        response = self.client.post(
+            reverse("scheduled-transfer-list"),
+            {
+                "receiver": self.receiver_wallet.id,
+                "amount": "30.00",
+                "cron": "61 * * * *",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_worker_executes_due_transfers_once(self):
+        now = timezone.now()
+        scheduled = ScheduledTransfer.objects.create(
+            sender=self.sender_wallet,
+            receiver=self.receiver_wallet,
+            amount=Decimal("30.00"),
+            interval=timedelta(days=7),
+            next_run_at=now - timedelta(minutes=1),
+        )
+        call_command("run_scheduled_transfers", "--once", stdout=StringIO())
+        call_command("run_scheduled_transfers", "--once", stdout=StringIO())
+
+        scheduled.refresh_from_db()
+        self.sender_wallet.refresh_from_db()
+        self.assertEqual(scheduled.run_count, 1)
+        self.assertGreater(scheduled.next_run_at, now)
+        self.assertEqual(self.sender_wallet.balance, Decimal("70.00"))
+
+    def test_worker_records_database_errors_per_row(self):
+        now = timezone.now()
+        broken, healthy = (
+            ScheduledTransfer.objects.create(
+                sender=self.sender_wallet,
+                receiver=self.receiver_wallet,
+                amount=Decimal("10.00"),
+                interval=timedelta(days=1),
+                next_run_at=now - timedelta(minutes=minutes),
+            )
+            for minutes in (2, 1)
+        )
+        execute = ScheduledTransfer.execute
+
+        def flaky_execute(scheduled):
+            if scheduled.pk == broken.pk:
+                raise DatabaseError("could not serialize access")
+            return execute(scheduled)
+
+        with mock.patch.object(ScheduledTransfer, "execute", flaky_execute):
+            call_command("run_scheduled_transfers", "--once", stdout=StringIO())
+
+        broken.refresh_from_db()
+        healthy.refresh_from_db()
+        self.assertEqual(broken.last_error, "could not serialize access")
+        self.assertEqual(broken.run_count, 0)
+        # The failed row keeps its lease and is retried once it expires.
+        self.assertGreater(broken.next_run_at, now)
+        self.assertEqual(healthy.run_count, 1)
+
+    def test_expired_lease_is_not_run_twice(self):
+        now = timezone.now()
+        scheduled = ScheduledTransfer.objects.create(
+            sender=self.sender_wallet,
+            receiver=self.receiver_wallet,
+            amount=Decimal("10.00"),
+            interval=timedelta(days=1),
+            next_run_at=now - timedelta(minutes=1),
+        )
+        # Another worker re-claimed the row after our lease expired.
+        ScheduledTransfer.objects.filter(pk=scheduled.pk).update(
+            next_run_at=now + timedelta(minutes=10)
+        )
+        command = RunScheduledTransfers()
+        self.assertIsNone(command.run_one(scheduled, now, now + timedelta(minutes=5)))
+        self.sender_wallet.refresh_from_db()
+        self.assertEqual(self.sender_wallet.balance, Decimal("100.00"))
+
+    def test_cron_schedule(self):
+        start = datetime(2025, 1, 31, 10, 30, tzinfo=dt_timezone.utc)
+        self.assertEqual(
+            CronSchedule("0 9 1 * *").next_after(start),
+            datetime(2025, 2, 1, 9, 0, tzinfo=dt_timezone.utc),
+        )
+        self.assertEqual(
+            CronSchedule("*/15 * * * 1-5").next_after(start),
+            datetime(2025, 1, 31, 10, 45, tzinfo=dt_timezone.utc),
+        )
+
+
+@skipUnless(
+    "drf_yasg" in settings.INSTALLED_APPS, "docs are off in the API-only profile"
+)
+class DocsTests(APITestCase):
+    def test_schema_is_generated_on_demand(self):
+        with self.assertNoLogs("drf_yasg", "WARNING"):
+            response = self.client.get(
+                reverse("schema-swagger-ui"), {"format": "openapi"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("/wallet/", response.json()["paths"])
+
+
+class TransactionSearchTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="search@test.com",
+            username="searchtest",
+            cpf="19283746500",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("100.00"))
+        self.friend = User.objects.create_user(
+            email="friend@test.com",
+            username="friendtest",
+            cpf="56473829100",
+            password="testpass123",
+        )
+        self.friend_wallet = Wallet.objects.create(user=self.friend)
+        Transfer.objects.create(
+            sender=self.wallet,
+            receiver=self.friend_wallet,
+            amount=Decimal("12.00"),
+            description="Pizza night",
+        )
+        self.wallet.deposit(Decimal("5.00"))
+        self.client.force_authenticate(self.user)
+
+    def test_search_by_memo_and_counterparty(self):
+        url = reverse("transaction-list")
+        for query in ("pizza", "friend@test.com", "PIZZA night"):
+            response = self.client.get(url, {"q": query})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.data["count"], 1, query)
+            self.assertEqual(response.data["results"][0]["amount"], "-12.00")
+
+    def test_search_is_scoped_to_callers_wallet(self):
+        self.client.force_authenticate(self.friend)
+        response = self.client.get(reverse("transaction-list"), {"q": "pizza"})
+        self.assertEqual(response.data["count"], 1)
+        self.assertEqual(response.data["results"][0]["amount"], "12.00")
+
+
+class HistoryDeltaSyncTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email="sync@test.com",
+            username="synctest",
+            cpf="31415926500",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user)
+        self.wallet.deposit(Decimal("10.00"))
+        self.wallet.deposit(Decimal("20.00"))
+        self.first, self.second = self.wallet.transactions.order_by("id")
+        self.client.force_authenticate(self.user)
+        self.url = reverse("transaction-list")
+
+    def test_since_id_returns_only_newer_rows(self):
+        response = self.client.get(self.url, {"since_id": self.first.pk})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row["id"] for row in response.data], [self.second.pk])
+
+        response = self.client.get(self.url, {"since_id": self.second.pk})
+        self.assertEqual(response.data, [])
+
+    def test_unchanged_history_returns_304(self):
+        params = {"since_id": self.second.pk}
+        etag = self.client.get(self.url, params)["ETag"]
+
+        # Answered from the wallet lookup and the ledger id aggregate alone.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+        # A different query or a new ledger row changes the tag.
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.wallet.deposit(Decimal("1.00"))
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 1)
+
+
+class NormalizedLedgerTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="11100011100", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="22200022200", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(
+            user=self.alice, balance=Decimal("50")
+        )
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+        self.client.force_authenticate(self.alice)
+
+    def test_new_rows_store_references_instead_of_text(self):
+        Transfer.objects.create(
+            sender=self.alice_wallet,
+            receiver=self.bob_wallet,
+            amount=Decimal("20.00"),
+            description="Lunch",
+        )
+        row = self.alice_wallet.transactions.get(transaction_type="TRANSFER")
+        self.assertEqual(row.description, "")
+        self.assertEqual(row.counterparty, self.bob_wallet)
+        self.assertEqual(row.get_description(), "Transfer to bob@test.com: Lunch")
+
+        response = self.client.get(reverse("transaction-list"))
+        self.assertEqual(
+            [item["description"] for item in response.data],
+            ["Transfer to bob@test.com: Lunch", "Withdrawal of 20.00"],
+        )
+
+    def test_history_keeps_counterparty_email_from_transfer_time(self):
+        Transfer.objects.create(
+            sender=self.alice_wallet, receiver=self.bob_wallet, amount=Decimal("5.00")
+        )
+        self.bob.email = "robert@test.com"
+        self.bob.save()
+        self.assertEqual(
+            self.client.get(reverse("transaction-list")).data[0]["description"],
+            "Transfer to bob@test.com: No description",
+        )
+
+        self.bob.delete()
+        self.alice_wallet.transactions.update(counterparty_email="")
+        self.assertEqual(
+            self.client.get(reverse("transaction-list")).data[0]["description"],
+            "Transfer to a closed account: No description",
+        )
+
+    def test_normalize_legacy_rows(self):
+        (transfer,) = Transfer.objects.bulk_create(
+            [
+                Transfer(
+                    sender=self.alice_wallet,
+                    receiver=self.bob_wallet,
+                    amount=Decimal("20.00"),
+                )
+            ]
+        )
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    wallet=self.alice_wallet,
+                    amount=Decimal("-20.00"),
+                    transaction_type="TRANSFER",
+                    description="Transfer to bob@test.com: No description",
+                ),
+                Transaction(
+                    wallet=self.bob_wallet,
+                    amount=Decimal("20.00"),
+                    transaction_type="TRANSFER",
+                    description="Transfer from alice@test.com: No description",
+                ),
+                Transaction(
+                    wallet=self.alice_wallet,
+                    amount=Decimal("5.00"),
+                    transaction_type="DEPOSIT",
+                    description="Deposit of 5",
+                ),
+            ]
+        )
+        before = self.client.get(reverse("transaction-list")).content
+
+        output = StringIO()
+        call_command("normalize_ledger", stdout=output)
+
+        self.assertIn("Normalized 2 rows", output.getvalue())
+        # Text describe() would render differently is left as written.
+        self.assertEqual(
+            list(
+                Transaction.objects.exclude(description="").values_list(
+                    "description", flat=True
+                )
+            ),
+            ["Deposit of 5"],
+        )
+        self.assertEqual(transfer.ledger_entries.count(), 2)
+        self.assertEqual(self.client.get(reverse("transaction-list")).content, before)
+
+
+class WalletEventsTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="events@test.com",
+            username="eventstest",
+            cpf="31415926535",
+            password="testpass123",
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("10.00"))
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+        self.connection = connections[DEFAULT_DB_ALIAS]
+
+    def deposit(self, amount):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wallet.deposit(amount)
+
+    def test_broker_failure_does_not_break_commit_callbacks(self):
+        other = User.objects.create_user(
+            email="other@test.com", username="other", cpf="27182818284", password="x"
+        )
+        other_wallet = Wallet.objects.create(user=other)
+        publish = mock.patch.object(
+            get_broker(), "publish", side_effect=ConnectionError("broker down")
+        )
+        with publish as publish, self.assertLogs("app.events", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                Transfer.objects.create(
+                    sender=self.wallet, receiver=other_wallet, amount=Decimal("4.00")
+                )
+        # Every ledger row was still published after the first failure.
+        self.assertEqual(publish.call_count, 4)
+        other_wallet.refresh_from_db()
+        self.assertEqual(other_wallet.balance, Decimal("4.00"))
+
+    async def test_stream_pushes_committed_transactions(self):
+        response = await self.async_client.get(
+            reverse("wallet-events"), headers={"authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+
+        snapshot = (await anext(stream)).decode()
+        self.assertIn('event: balance\ndata: {"wallet_id"', snapshot)
+        self.assertIn('"balance": "10.00"', snapshot)
+
+        await sync_to_async(self.deposit)(Decimal("5.00"))
+        event = (await asyncio.wait_for(anext(stream), timeout=5)).decode()
+        self.assertIn("event: transaction", event)
+        self.assertIn('"balance": "15.00"', event)
+        self.assertIn('"transaction_type": "DEPOSIT"', event)
+        await response.streaming_content.aclose()
+
+    async def test_commit_while_subscribing_is_not_lost(self):
+        broker = get_broker()
+        subscribe = broker.subscribe
+        main_connection = self.connection
+
+        def subscribe_after_deposit(channel):
+            # Runs on the event loop thread: borrow the test's connection so
+            # the deposit lands in its transaction, between the wallet lookup
+            # and the balance snapshot.
+            own_connection = connections[DEFAULT_DB_ALIAS]
+            connections[DEFAULT_DB_ALIAS] = main_connection
+            main_connection.inc_thread_sharing()
+            try:
+                with mock.patch.dict(os.environ, {"DJANGO_ALLOW_ASYNC_UNSAFE": "true"}):
+                    self.deposit(Decimal("5.00"))
+            finally:
+                main_connection.dec_thread_sharing()
+                connections[DEFAULT_DB_ALIAS] = own_connection
+            return subscribe(channel)
+
+        with mock.patch.object(broker, "subscribe", subscribe_after_deposit):
+            response = await self.async_client.get(
+                reverse("wallet-events"),
+                headers={"authorization": f"Bearer {self.token}"},
+            )
+        snapshot = (await anext(aiter(response.streaming_content))).decode()
+        self.assertIn('"balance": "15.00"', snapshot)
+        await response.streaming_content.aclose()
+
+    async def test_stream_requires_authentication(self):
+        response = await self.async_client.get(reverse("wallet-events"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SettlementImportTests(APITestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="11100011100", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="22200022200", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(
+            user=self.alice, balance=Decimal("5.00")
+        )
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+
+    def write_file(self, content):
+        fd, path = tempfile.mkstemp(suffix=".csv")
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_applies_deposits_once(self):
+        path = self.write_file(
+            "cpf,amount,reference\n"
+            "11100011100,10.00,A1\n"
+            "11100011100,2.50,A2\n"
+            "22200022200,7.00,B1\n"
+            "99900099900,1.00,X1\n"
+        )
+        output = StringIO()
+        call_command("import_settlement", path, stdout=output)
+        call_command("import_settlement", path, stdout=output)
+
+        self.alice_wallet.refresh_from_db()
+        self.bob_wallet.refresh_from_db()
+        self.assertEqual(self.alice_wallet.balance, Decimal("17.50"))
+        self.assertEqual(self.bob_wallet.balance, Decimal("7.00"))
+        self.assertEqual(
+            sorted(self.alice_wallet.transactions.values_list("amount", flat=True)),
+            [Decimal("2.50"), Decimal("10.00")],
+        )
+
+        settlement = SettlementFile.objects.get()
+        self.assertEqual((settlement.row_count, settlement.applied_count), (4, 3))
+        self.assertEqual(
+            list(settlement.entries.values_list("cpf", flat=True)), ["99900099900"]
+        )
+        self.assertIn("already imported", output.getvalue())
+
+    def test_invalid_row_rolls_back_file(self):
+        path = self.write_file("cpf,amount\n11100011100,10.00\n22200022200,-3\n")
+        with self.assertRaisesMessage(CommandError, "Line 3"):
+            call_command("import_settlement", path, stdout=StringIO())
+
+        self.alice_wallet.refresh_from_db()
+        self.assertEqual(self.alice_wallet.balance, Decimal("5.00"))
+        self.assertFalse(SettlementFile.objects.exists())
+
+    def test_import_enqueues_deposit_webhooks(self):
+        WebhookSubscription.objects.create(user=self.alice, url="https://a.test/")
+        path = self.write_file(
+            "cpf,amount\n11100011100,10.00\n22200022200,7.00\n11100011100,2.50\n"
+        )
+        call_command("import_settlement", path, stdout=StringIO())
+
+        payloads = [
+            delivery.payload for delivery in WebhookDelivery.objects.order_by("id")
+        ]
+        self.assertEqual(
+            [(p["event"], p["transaction"]["amount"], p["balance"]) for p in payloads],
+            [
+                ("deposit.created", "10.00", "15.00"),
+                ("deposit.created", "2.50", "17.50"),
+            ],
+        )
+
+    def test_non_finite_and_oversized_amounts_are_rejected(self):
+        for amount in ("NaN", "-Infinity", "sNaN", "1e20", "10000000000.00"):
+            path = self.write_file(f"cpf,amount\n11100011100,{amount}\n")
+            with self.subTest(amount=amount), self.assertRaisesMessage(
+                CommandError, "Line 2: invalid amount"
+            ):
+                call_command("import_settlement", path, stdout=StringIO())
+        self.assertFalse(SettlementFile.objects.exists())
+
+
+class StubReceiver(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.received.append((dict(self.headers), body))
+        self.send_response(self.server.status_code)
+        for header, value in self.server.headers.items():
+            self.send_header(header, value)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@override_settings(WEBHOOKS={**settings.WEBHOOKS, "ALLOW_PRIVATE_NETWORKS": True})
+class WebhookTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="11100011100", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="22200022200", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(
+            user=self.alice, balance=Decimal("50.00")
+        )
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubReceiver)
+        self.server.received, self.server.status_code = [], 200
+        self.server.headers = {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.subscription = WebhookSubscription.objects.create(
+            user=self.alice, url=f"http://127.0.0.1:{self.server.server_port}/hook"
+        )
+
+    def test_transfer_delivers_signed_webhook(self):
+        Transfer.objects.create(
+            sender=self.alice_wallet, receiver=self.bob_wallet, amount=Decimal("20.00")
+        )
+        self.assertEqual(
+            list(WebhookDelivery.objects.values_list("event", flat=True)),
+            ["transfer.sent"],
+        )
+
+        output = StringIO()
+        call_command("dispatch_webhooks", "--once", stdout=output)
+        self.assertIn("deliveries/s", output.getvalue())
+
+        headers, body = self.server.received[0]
+        self.assertEqual(
+            headers["X-Webhook-Signature"],
+            sign(self.subscription.secret, headers["X-Webhook-Timestamp"], body),
+        )
+        payload = json.loads(body)
+        self.assertEqual(payload["event"], "transfer.sent")
+        self.assertEqual(payload["balance"], "30.00")
+        self.assertEqual(payload["transaction"]["amount"], "-20.00")
+        self.assertEqual(WebhookDelivery.objects.get().status, "DELIVERED")
+
+    def test_failing_endpoint_backs_off_and_opens_circuit(self):
+        self.server.status_code = 500
+        for _ in range(3):
+            self.alice_wallet.deposit(Decimal("1.00"))
+
+        webhooks = {**settings.WEBHOOKS, "CIRCUIT_THRESHOLD": 2}
+        with override_settings(WEBHOOKS=webhooks):
+            call_command(
+                "dispatch_webhooks", "--once", "--concurrency", "1", stdout=StringIO()
+            )
+
+        self.assertEqual(len(self.server.received), 2)
+        self.subscription.refresh_from_db()
+        self.assertEqual(self.subscription.consecutive_failures, 2)
+        self.assertGreater(self.subscription.circuit_open_until, timezone.now())
+        deliveries = WebhookDelivery.objects.order_by("pk")
+        self.assertEqual([d.attempts for d in deliveries], [1, 1, 0])
+        self.assertTrue(
+            all(
+                d.status == "PENDING"
+                and d.next_attempt_at >= self.subscription.circuit_open_until
+                for d in deliveries
+            )
+        )
+
+    def test_expired_lease_is_not_recorded(self):
+        self.alice_wallet.deposit(Decimal("1.00"))
+        reclaimed_until = timezone.now() + timedelta(minutes=10)
+        record = DispatchWebhooks.record
+
+        def record_after_reclaim(command, due, results, leased_until):
+            # Another worker claimed the row while this one was sending.
+            WebhookDelivery.objects.update(next_attempt_at=reclaimed_until)
+            return record(command, due, results, leased_until)
+
+        with mock.patch.object(DispatchWebhooks, "record", record_after_reclaim):
+            call_command("dispatch_webhooks", "--once", stdout=StringIO())
+
+        self.assertEqual(len(self.server.received), 1)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.attempts), ("PENDING", 0))
+        self.assertEqual(delivery.next_attempt_at, reclaimed_until)
+
+    def test_redirects_are_not_followed(self):
+        self.server.status_code = 302
+        self.server.headers = {"Location": "http://169.254.169.254/latest/"}
+        self.alice_wallet.deposit(Decimal("1.00"))
+        call_command("dispatch_webhooks", "--once", stdout=StringIO())
+
+        self.assertEqual(len(self.server.received), 1)
+        delivery = WebhookDelivery.objects.get()
+        self.assertEqual((delivery.status, delivery.last_status_code), ("PENDING", 302))
+
+    def test_delivery_to_private_address_is_refused(self):
+        self.alice_wallet.deposit(Decimal("1.00"))
+        webhooks = {**settings.WEBHOOKS, "ALLOW_PRIVATE_NETWORKS": False}
+        with override_settings(WEBHOOKS=webhooks):
+            call_command("dispatch_webhooks", "--once", stdout=StringIO())
+
+        self.assertEqual(self.server.received, [])
+        self.assertIn("non-public address", WebhookDelivery.objects.get().last_error)
+
+    @override_settings(WEBHOOKS={**settings.WEBHOOKS, "ALLOW_PRIVATE_NETWORKS": False})
+    def test_subscription_requires_public_https_url(self):
+        self.client.force_authenticate(self.bob)
+        url = reverse("webhook-list")
+        response = self.client.post(url, {"url": "http://example.com/hook"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for private in ("127.0.0.1", "10.1.2.3", "169.254.169.254", "[::1]"):
+            response = self.client.post(url, {"url": f"https://{private}/hook"})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        public = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.215.14", 443))]
+        with mock.patch("socket.getaddrinfo", return_value=public):
+            response = self.client.post(url, {"url": "https://example.com/hook"})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["secret"]), 64)
+
+
+class VelocityLimitTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tier = LimitTier.objects.create(
+            name="basic",
+            hourly_transfer_limit=Decimal("30.00"),
+            daily_withdrawal_limit=Decimal("10.00"),
+        )
+        self.alice = User.objects.create_user(
+            email="alice@test.com",
+            username="alice",
+            cpf="11100011100",
+            password="x",
+            limit_tier=self.tier,
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="22200022200", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(
+            user=self.alice, balance=Decimal("100.00")
+        )
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+        self.client.force_authenticate(self.alice)
+
+    def transfer(self, amount):
+        return self.client.post(
+            reverse("transfer-create"),
+            {
+                "sender": self.alice_wallet.pk,
+                "receiver": self.bob_wallet.pk,
+                "amount": amount,
+            },
+            format="json",
+        )
+
+    def test_hourly_transfer_limit(self):
+        self.assertEqual(self.transfer("20.00").status_code, status.HTTP_201_CREATED)
+        response = self.transfer("15.00")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Hourly transfer limit", str(response.data))
+        self.alice_wallet.refresh_from_db()
+        self.assertEqual(self.alice_wallet.balance, Decimal("80.00"))
+
+    def test_withdrawals_are_counted_apart_from_transfers(self):
+        self.assertEqual(self.transfer("20.00").status_code, status.HTTP_201_CREATED)
+        self.alice_wallet.refresh_from_db()
+        self.alice_wallet.withdraw(Decimal("6.00"))
+        with self.assertRaisesMessage(ValueError, "Daily withdrawal limit"):
+            self.alice_wallet.withdraw(Decimal("5.00"))
+
+        self.alice_wallet.refresh_from_db()
+        self.assertEqual(self.alice_wallet.balance, Decimal("74.00"))
+        self.assertEqual(
+            VelocityBucket.usage(self.alice_wallet.pk, "WITHDRAWAL"),
+            (Decimal("6.00"), Decimal("6.00")),
+        )
+
+    def test_holds_count_against_withdrawal_limits(self):
+        first = Hold.authorize(self.alice_wallet, Decimal("6.00"))
+        with self.assertRaisesMessage(ValueError, "Daily withdrawal limit"):
+            Hold.authorize(self.alice_wallet, Decimal("5.00"))
+        self.alice_wallet.refresh_from_db()
+        self.assertEqual(self.alice_wallet.held_balance, Decimal("6.00"))
+
+        first.capture(Decimal("2.00"))
+        second = Hold.authorize(self.alice_wallet, Decimal("5.00"))
+        second.void()
+        Hold.authorize(self.alice_wallet, Decimal("8.00"))
+        self.assertEqual(
+            VelocityBucket.usage(self.alice_wallet.pk, "WITHDRAWAL"),
+            (Decimal("10.00"), Decimal("10.00")),
+        )
+
+    def test_usage_rolls_off_old_buckets(self):
+        now = timezone.now()
+        VelocityBucket.record(
+            self.alice_wallet.pk, "TRANSFER", Decimal("7"), now - timedelta(hours=2)
+        )
+        VelocityBucket.record(
+            self.alice_wallet.pk, "TRANSFER", Decimal("5"), now - timedelta(hours=30)
+        )
+        VelocityBucket.record(self.alice_wallet.pk, "TRANSFER", Decimal("1"), now)
+        self.assertEqual(
+            VelocityBucket.usage(self.alice_wallet.pk, "TRANSFER", now),
+            (Decimal("1"), Decimal("8")),
+        )
+
+
+class ProfilingTests(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.staff = User.objects.create_user(
+            email="staff@test.com",
+            username="staff",
+            cpf="33300033300",
+            password="x",
+            is_staff=True,
+        )
+        self.customer = User.objects.create_user(
+            email="customer@test.com",
+            username="customer",
+            cpf="44400044400",
+            password="x",
+        )
+        self.staff_wallet = Wallet.objects.create(
+            user=self.staff, balance=Decimal("50.00")
+        )
+        self.customer_wallet = Wallet.objects.create(user=self.customer)
+        self.staff_wallet.deposit(Decimal("10.00"))
+
+    def authenticate(self, user):
+        token = RefreshToken.for_user(user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_staff_get_json_report(self):
+        self.authenticate(self.staff)
+        response = self.client.get(reverse("transaction-list"), {"_profile": "json"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        report = response.json()
+        self.assertEqual(report["status"], 200)
+        self.assertGreater(report["sql"]["count"], 0)
+        self.assertTrue(
+            any(
+                frame.startswith("app/views.py")
+                for query in report["sql"]["queries"]
+                for frame in query["origin"]
+            )
+        )
+        self.assertTrue(report["functions"])
+
+    def test_transfer_profile_as_pstats(self):
+        self.authenticate(self.staff)
+        response = self.client.post(
+            reverse("transfer-create"),
+            {
+                "sender": self.staff_wallet.pk,
+                "receiver": self.customer_wallet.pk,
+                "amount": "5.00",
+            },
+            format="json",
+            HTTP_X_PROFILE="pstats",
+        )
+        self.assertEqual(response["Content-Type"], "application/octet-stream")
+        stats = marshal.loads(response.content)
+        self.assertTrue(any(name == "perform_create" for _, _, name in stats))
+        self.customer_wallet.refresh_from_db()
+        self.assertEqual(self.customer_wallet.balance, Decimal("5.00"))
+
+    def test_flag_is_ignored_for_non_staff(self):
+        self.authenticate(self.customer)
+        response = self.client.get(reverse("transaction-list"), HTTP_X_PROFILE="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+
+
+@override_settings(
+    TRACING={
+        **settings.TRACING,
+        "SINK": "app.tracing.InMemorySink",
+        "SAMPLE_RATE": 0.0,
+        "TRUST_INBOUND_SAMPLING": True,
+    }
+)
+class TracingTests(APITestCase):
+    trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+
+    def setUp(self):
+        self.client = APIClient()
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="11100011100", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="22200022200", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(
+            user=self.alice, balance=Decimal("50.00")
+        )
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+        self.client.force_authenticate(self.alice)
+        self.sink = get_sink()
+        self.sink.clear()
+
+    def transfer(self, traceparent=None):
+        headers = {"HTTP_TRACEPARENT": traceparent} if traceparent else {}
+        return self.client.post(
+            reverse("transfer-create"),
+            {
+                "sender": self.alice_wallet.pk,
+                "receiver": self.bob_wallet.pk,
+                "amount": "10.00",
+            },
+            format="json",
+            **headers,
+        )
+
+    def test_transfer_phases_continue_incoming_trace(self):
+        response = self.transfer(f"00-{self.trace_id}-00f067aa0ba902b7-01")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response["X-Trace-Id"], self.trace_id)
+
+        spans = {span.name: span for span in self.sink.spans}
+        self.assertTrue(
+            {
+                "transfer.validate",
+                "transfer.perform_create",
+                "transfer.save",
+                "wallet.withdraw",
+                "wallet.deposit",
+                "wallet.balance_update",
+                "ledger.insert",
+                "transfer.serialize",
+            }
+            <= set(spans)
+        )
+        self.assertEqual({span.trace_id for span in self.sink.spans}, {self.trace_id})
+        root = spans["POST /api/transfer/"]
+        self.assertEqual(root.parent_id, "00f067aa0ba902b7")
+        self.assertEqual(root.attributes["http.status_code"], 201)
+        self.assertEqual(
+            spans["transfer.save"].parent_id, spans["transfer.perform_create"].span_id
+        )
+        self.assertGreater(spans["wallet.balance_update"].attributes["db.queries"], 0)
+
+        otlp = to_otlp(self.sink.spans)["resourceSpans"][0]["scopeSpans"][0]
+        self.assertEqual(len(otlp["spans"]), len(self.sink.spans))
+
+    def test_unsampled_requests_record_nothing(self):
+        self.transfer()
+        self.transfer(f"00-{self.trace_id}-00f067aa0ba902b7-00")
+        self.assertEqual(self.sink.spans, [])
+
+        with override_settings(TRACING={**settings.TRACING, "SAMPLE_RATE": 1.0}):
+            response = self.client.post(
+                reverse("wallet-deposit"), {"amount": "5.00"}, format="json"
+            )
+        self.assertIn("wallet.deposit", {span.name for span in self.sink.spans})
+        self.assertEqual(len(response["X-Trace-Id"]), 32)
+
+    def test_untrusted_sampled_flag_is_ignored(self):
+        traceparent = f"00-{self.trace_id}-00f067aa0ba902b7-01"
+        tracing = {**settings.TRACING, "TRUST_INBOUND_SAMPLING": False}
+        with override_settings(TRACING=tracing):
+            self.transfer(traceparent)
+            self.assertEqual(self.sink.spans, [])
+
+            with override_settings(TRACING={**tracing, "SAMPLE_RATE": 1.0}):
+                response = self.transfer(traceparent)
+        self.assertEqual(response["X-Trace-Id"], self.trace_id)
+
+    def test_file_sink_writes_in_the_background(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            with override_settings(TRACING={**settings.TRACING, "FILE": path}):
+                sink = FileSink()
+            self.transfer(f"00-{self.trace_id}-00f067aa0ba902b7-01")
+            sink.export(self.sink.spans)
+            sink.queue.join()
+            with open(path) as f:
+                document = json.loads(f.read())
+        spans = document["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual({span["traceId"] for span in spans}, {self.trace_id})
+
+
+class HoldTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email="hold@test.com", username="hold", cpf="31415926535", password="x"
+        )
+        self.wallet = Wallet.objects.create(user=self.user, balance=Decimal("100.00"))
+        self.client.force_authenticate(self.user)
+
+    def authorize(self, amount, **extra):
+        return self.client.post(
+            reverse("hold-list"), {"amount": amount, **extra}, format="json"
+        )
+
+    def test_authorize_reserves_available_balance(self):
+        response = self.authorize("70.00")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], "AUTHORIZED")
+
+        wallet = self.client.get(reverse("wallet-detail")).data
+        self.assertEqual(wallet["balance"], "100.00")
+        self.assertEqual(wallet["held_balance"], "70.00")
+        self.assertEqual(wallet["available_balance"], "30.00")
+        self.assertFalse(self.wallet.transactions.exists())
+
+        self.assertEqual(self.authorize("40.00").status_code, 400)
+        with self.assertRaisesMessage(ValueError, "Insufficient funds"):
+            Wallet.objects.get(pk=self.wallet.pk).withdraw(Decimal("40.00"))
+
+    def test_capture_writes_one_ledger_entry_and_void_releases(self):
+        hold_id = self.authorize("60.00").data["id"]
+        response = self.client.post(
+            reverse("hold-capture", args=[hold_id]), {"amount": "45.00"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["captured_amount"], "45.00")
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("55.00"))
+        self.assertEqual(self.wallet.held_balance, Decimal("0.00"))
+        self.assertEqual(
+            list(self.wallet.transactions.values_list("amount", "transaction_type")),
+            [(Decimal("45.00"), "WITHDRAWAL")],
+        )
+        response = self.client.post(reverse("hold-void", args=[hold_id]))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        hold_id = self.authorize("20.00").data["id"]
+        self.client.post(reverse("hold-void", args=[hold_id]))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.held_balance, Decimal("0.00"))
+
+    def test_stale_wallet_does_not_overwrite_capture(self):
+        stale, other = (Wallet.objects.get(pk=self.wallet.pk) for _ in range(2))
+        Hold.authorize(self.wallet, Decimal("60.00")).capture()
+
+        stale.deposit(Decimal("10.00"))
+        self.assertEqual(stale.balance, Decimal("50.00"))
+        # Still believes the balance is 100.00; the locked row says otherwise.
+        with self.assertRaisesMessage(ValueError, "Insufficient funds"):
+            other.withdraw(Decimal("60.00"))
+        other.withdraw(Decimal("50.00"))
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, Decimal("0.00"))
+
+    def test_expire_holds_releases_due_holds(self):
+        hold = Hold.authorize(self.wallet, Decimal("30.00"))
+        Hold.authorize(self.wallet, Decimal("10.00"))
+        Hold.objects.filter(pk=hold.pk).update(
+            expires_at=timezone.now() - timedelta(minutes=1)
+        )
+        out = StringIO()
+        call_command("expire_holds", "--batch-size", "1", stdout=out)
+        self.assertIn("Expired 1 holds", out.getvalue())
+
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, "EXPIRED")
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.held_balance, Decimal("10.00"))
+        self.assertEqual(
+            VelocityBucket.usage(self.wallet.pk, "WITHDRAWAL"),
+            (Decimal("10.00"), Decimal("10.00")),
+        )
+        with self.assertRaisesMessage(ValueError, "no longer authorized"):
+            hold.capture()
+
+
+@skipUnless(
+    "django.contrib.admin" in settings.INSTALLED_APPS,
+    "admin is off in the API-only profile",
+)
+class AdminTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(
+            email="admin@test.com", username="admin", cpf="00000000001", password="x"
+        )
+        self.client.force_login(self.admin)
+        self.wallets = []
+        for i in range(2):
+            user = User.objects.create_user(
+                email=f"u{i}@test.com", username=f"u{i}", cpf=f"1000000000{i}"
+            )
+            self.wallets.append(
+                Wallet.objects.create(user=user, balance=Decimal("100.00"))
+            )
+
+    def transfer(self):
+        Transfer.objects.create(
+            sender=Wallet.objects.get(pk=self.wallets[0].pk),
+            receiver=Wallet.objects.get(pk=self.wallets[1].pk),
+            amount=Decimal("1.00"),
+        )
+
+    def changelist_queries(self, model):
+        url = reverse(f"admin:app_{model}_changelist")
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn("created_at__month=", response["Location"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(response["Location"]).status_code, 200)
+        return len(queries)
+
+    def test_ledger_changelists_do_not_query_per_row(self):
+        self.transfer()
+        counts = {
+            model: self.changelist_queries(model)
+            for model in ("transaction", "transfer")
+        }
+        for _ in range(5):
+            self.transfer()
+        for model, count in counts.items():
+            self.assertEqual(self.changelist_queries(model), count)
+
+    def test_default_month_only_applies_to_the_bare_changelist(self):
+        self.transfer()
+        url = reverse("admin:app_transaction_changelist")
+        response = self.client.get(url, {"created_at__year": timezone.now().year})
+        all_dates = response.context["cl"].get_query_string(remove=["created_at__"])
+        self.assertEqual(all_dates, "?dates=all")
+        self.assertContains(response, f'href="{all_dates}"')
+
+        wallet = self.wallets[0].pk
+        for params in ({"dates": "all"}, {"q": "u0"}, {"wallet__id__exact": wallet}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+        response = self.client.get(url, {"dates": "all"})
+        self.assertEqual(response.context["cl"].result_count, 4)
+
+    def test_wallet_and_user_search_by_exact_alias(self):
+        for model in ("wallet", "user"):
+            url = reverse(f"admin:app_{model}_changelist")
+            response = self.client.get(url, {"q": "u1@test.com"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.client.get(
+            reverse("admin:app_wallet_change", args=[self.wallets[0].pk])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="balance"')
+
+    def test_estimated_paginator_counts_small_results_exactly(self):
+        paginator = EstimatedCountPaginator(Wallet.objects.order_by("pk"), 1)
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 2)
+
+
+class TransferByAliasTests(APITestCase):
+    def setUp(self):
+        get_alias_cache().clear()
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="12345678901", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="10987654321", password="x"
+        )
+        self.alice_wallet = Wallet.objects.create(user=self.alice, balance=100)
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+        self.client.force_authenticate(self.alice)
+
+    def transfer(self, **receiver):
+        return self.client.post(
+            reverse("transfer-create"),
+            {"sender": self.alice_wallet.pk, "amount": "10.00", **receiver},
+            format="json",
+        )
+
+    def test_transfer_by_email_or_cpf(self):
+        response = self.transfer(receiver_email="bob@test.com")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["receiver_email"], "bob@test.com")
+        self.assertNotIn("receiver_cpf", response.data)
+        self.assertEqual(
+            self.transfer(receiver_cpf="10987654321").status_code,
+            status.HTTP_201_CREATED,
+        )
+        self.bob_wallet.refresh_from_db()
+        self.assertEqual(self.bob_wallet.balance, Decimal("20.00"))
+
+        response = self.transfer(
+            receiver=self.bob_wallet.pk, receiver_email="bob@test.com"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("receiver", response.data)
+        response = self.transfer(receiver_email="nobody@test.com")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("receiver_email", response.data)
+
+    def test_cached_alias_saves_the_user_lookup(self):
+        with CaptureQueriesContext(connection) as miss:
+            self.transfer(receiver_email="bob@test.com")
+        with CaptureQueriesContext(connection) as hit:
+            self.transfer(receiver_email="bob@test.com")
+
+        def user_lookups(queries):
+            return [q for q in queries if 'FROM "app_user" WHERE' in q["sql"]]
+
+        self.assertEqual(len(user_lookups(miss)), 1)
+        self.assertEqual(user_lookups(hit), [])
+
+    def test_user_changes_invalidate_the_alias(self):
+        self.transfer(receiver_email="bob@test.com")
+        self.bob.email = "robert@test.com"
+        self.bob.save()
+        carol = User.objects.create_user(
+            email="bob@test.com", username="carol", cpf="55555555555", password="x"
+        )
+        carol_wallet = Wallet.objects.create(user=carol)
+
+        self.assertEqual(
+            self.transfer(receiver_email="bob@test.com").status_code,
+            status.HTTP_201_CREATED,
+        )
+        carol_wallet.refresh_from_db()
+        self.assertEqual(carol_wallet.balance, Decimal("10.00"))
+
+        # Another process may still hold the old entry; it is checked before use.
+        get_alias_cache().set(("email", "robert@test.com"), carol.pk, carol_wallet.pk)
+        self.transfer(receiver_email="robert@test.com")
+        self.bob_wallet.refresh_from_db()
+        self.assertEqual(self.bob_wallet.balance, Decimal("20.00"))
+
+    def test_alias_cache_is_bounded_lru_with_ttl(self):
+        cache = AliasCache(max_size=2, ttl=60)
+        cache.set(("email", "a"), 1, 1)
+        cache.set(("email", "b"), 2, 2)
+        cache.get(("email", "a"))
+        cache.set(("email", "c"), 3, 3)
+        self.assertIsNone(cache.get(("email", "b")))
+        self.assertEqual(cache.get(("email", "a")), (1, 1))
+
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get(("email", "a")))
+        self.assertEqual(cache.keys_by_user, {3: {("email", "c")}})
+
+        expired = AliasCache(max_size=2, ttl=0)
+        expired.set(("cpf", "1"), 1, 1)
+        self.assertIsNone(expired.get(("cpf", "1")))
+
+
+@skipUnless(
+    len(settings.WALLET_SHARDS) > 1,
+    "Set WALLET_SHARDS to two or more databases to test sharding",
+)
+class ShardingTests(APITestCase):
+    databases = "__all__"
+
+    def setUp(self):
+        self.alice = User.objects.create_user(
+            email="alice@test.com", username="alice", cpf="12345678901", password="x"
+        )
+        self.bob = User.objects.create_user(
+            email="bob@test.com", username="bob", cpf="10987654321", password="x"
+        )
+        self.alice_shard = shard_for_user(self.alice.pk)
+        self.bob_shard = shard_for_user(self.bob.pk)
+        self.assertNotEqual(self.alice_shard, self.bob_shard)
+        self.alice_wallet = Wallet.objects.create(user=self.alice, balance=100)
+        self.bob_wallet = Wallet.objects.create(user=self.bob)
+        self.client.force_authenticate(self.alice)
+
+    def transfer(self, amount="40.00"):
+        return self.client.post(
+            reverse("transfer-create"),
+            {
+                "sender": self.alice_wallet.pk,
+                "receiver": self.bob_wallet.pk,
+                "amount": amount,
+                "description": "Rent",
+            },
+            format="json",
+        )
+
+    def balance(self, wallet):
+        return Wallet.objects.for_wallet(wallet.pk).get().balance
+
+    def test_wallets_live_on_their_owners_shard(self):
+        self.assertEqual(self.alice_wallet.pk, self.alice.pk)
+        self.assertEqual(self.alice_wallet._state.db, self.alice_shard)
+        self.assertFalse(Wallet.objects.using(self.bob_shard).filter(user=self.alice))
+        self.assertTrue(User.objects.using(self.alice_shard).filter(pk=self.alice.pk))
+
+        response = self.client.get(reverse("wallet-detail"))
+        self.assertEqual(response.data["user_email"], "alice@test.com")
+
+    def test_cross_shard_transfer(self):
+        with self.captureOnCommitCallbacks(execute=True, using=self.alice_shard):
+            response = self.transfer()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["receiver_email"], "bob@test.com")
+        self.assertEqual(self.balance(self.alice_wallet), Decimal("60.00"))
+        self.assertEqual(self.balance(self.bob_wallet), Decimal("40.00"))
+
+        intent = TransferIntent.objects.using(self.alice_shard).get()
+        self.assertEqual(intent.status, "COMPLETED")
+        self.assertEqual(
+            TransferIntent.objects.using(self.bob_shard).get(pk=intent.pk).status,
+            "CREDITED",
+        )
+
+        self.client.force_authenticate(self.bob)
+        history = self.client.get(reverse("transaction-list")).data
+        self.assertIn(
+            "Transfer from alice@test.com: Rent", {t["description"] for t in history}
+        )
+
+    def test_credit_waits_for_the_debit_to_commit(self):
+        with self.captureOnCommitCallbacks(using=self.alice_shard) as callbacks:
+            self.assertEqual(self.transfer().status_code, status.HTTP_201_CREATED)
+            self.assertEqual(self.balance(self.bob_wallet), Decimal("0.00"))
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.balance(self.bob_wallet), Decimal("40.00"))
+
+    def test_interrupted_credit_is_resumed_once(self):
+        failing_credit = mock.patch.object(
+            TransferIntent, "apply", side_effect=DatabaseError("shard down")
+        )
+        with failing_credit, self.assertLogs("django", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True, using=self.alice_shard):
+                self.assertEqual(self.transfer().status_code, status.HTTP_201_CREATED)
+        intent = TransferIntent.objects.using(self.alice_shard).get()
+        self.assertEqual(intent.status, "DEBITED")
+        self.assertEqual(self.balance(self.bob_wallet), Decimal("0.00"))
+
+        call_command("resume_transfer_intents", "--grace", "-1", stdout=StringIO())
+        intent.apply()  # a late retry must not credit twice
+        intent.refresh_from_db()
+        self.assertEqual(intent.status, "COMPLETED")
+        self.assertEqual(self.balance(self.bob_wallet), Decimal("40.00"))
+        self.assertEqual(self.balance(self.alice_wallet), Decimal("60.00"))
+
+    def test_scheduled_transfer_across_shards(self):
+        response = self.client.post(
+            reverse("scheduled-transfer-list"),
+            {
+                "receiver": self.bob_wallet.pk,
+                "amount": "30.00",
+                "description": "Rent",
+                "cron": "0 9 1 * *",
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        scheduled = ScheduledTransfer.objects.using(self.alice_shard)
+        self.assertEqual(scheduled.count(), 1)
+        self.assertEqual(
+            self.client.get(reverse("scheduled-transfer-list")).data[0][
+                "receiver_email"
+            ],
+            "bob@test.com",
+        )
+
+        scheduled.update(next_run_at=timezone.now() - timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True, using=self.alice_shard):
+            call_command("run_scheduled_transfers", "--once", stdout=StringIO())
+        self.assertEqual(scheduled.get().run_count, 1)
+        self.assertEqual(self.balance(self.alice_wallet), Decimal("70.00"))
+        self.assertEqual(self.balance(self.bob_wallet), Decimal("30.00"))
+
+    @override_settings(
+        TRACING={
+            **settings.TRACING,
+            "SINK": "app.tracing.InMemorySink",
+            "SAMPLE_RATE": 1.0,
+        }
+    )
+    def test_queries_are_timed_on_every_shard(self):
+        with start_trace("transfer") as root:
+            with self.captureOnCommitCallbacks(execute=True, using=self.alice_shard):
+                Transfer.objects.create(
+                    sender=self.alice_wallet,
+                    receiver=self.bob_wallet,
+                    amount=Decimal("10.00"),
+                )
+            for alias in (self.alice_shard, self.bob_shard):
+                self.assertEqual(len(connections[alias].execute_wrappers), 1)
+        self.assertGreater(root.attributes["db.queries"], 0)
+        self.assertEqual(connections[self.bob_shard].execute_wrappers, [])
@@ -0,0 +1,203 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class LocalMemoryBucketStore:
+    """
+    Token buckets kept in process memory, bounded to ``max_keys`` entries
+    (least recently used buckets are dropped first).
+    """
+
+    def __init__(self, max_keys=100_000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def consume(self, key, capacity, refill_rate, now):
+        with self.lock:
+            tokens, updated_at = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self.buckets[key] = (tokens, now)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+    def clear(self):
+        with self.lock:
+            self.buckets.clear()
+
+
+class CacheBucketStore:
+    """
+    Token buckets shared between workers through a Django cache.
+
+    Updates are read-modify-write, so concurrent requests for the same key
+    may occasionally both get the last token.
+    """
+
+    def __init__(self, alias="default"):
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_rate, now):
+        tokens, updated_at = self.cache.get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.cache.set(key, (tokens, now), timeout=math.ceil(capacity / refill_rate))
+        return allowed, 0 if allowed else (1 - tokens) / refill_rate
+
+    def clear(self):
+        self.cache.clear()
+
+
+_stores = {}
+
+
+def get_bucket_store():
+    path = getattr(
+        settings, "THROTTLE_BUCKET_STORE", "app.throttling.LocalMemoryBucketStore"
+    )
+    if path not in _stores:
+        _stores[path] = import_string(path)()
+    return _stores[path]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Token-bucket throttle configured by the view's ``throttle_scope``.
+
+    A rate of ``"30/min"`` allows bursts of 30 requests refilled at 30 per
+    minute. Views without a scope, or scopes without a configured rate, are
+    not throttled.
+    """
+
+    scope_suffix = ""
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_ident_key(self, request):
+        raise NotImplementedError(".get_ident_key() must be overridden")
+
+    def parse_rate(self, rate):
+        num, period = rate.split("/")
+        capacity = int(num)
+        return capacity, capacity / DURATIONS[period[0]]
+
+    def allow_request(self, request, view):
+        scope = getattr(view, "throttle_scope", None)
+        if not scope:
+            return True
+        scope += self.scope_suffix
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        capacity, refill_rate = self.parse_rate(rate)
+        key = f"throttle:{scope}:{self.get_ident_key(request)}"
+        allowed, self.wait_time = get_bucket_store().consume(
+            key, capacity, refill_rate, time.time()
+        )
+        return allowed
+
+    def wait(self):
+        return self.wait_time
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    def get_ident_key(self, request):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    scope_suffix = "_ip"
+
+    def get_ident_key(self, request):
+        return f"ip:{self.get_ident(request)}"
+
+
+class ServiceOverloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service temporarily overloaded, try again later."
+    default_code = "service_unavailable"
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        self.wait = wait
+
+
+class LoadShedder:
+    def __init__(self, max_in_flight, retry_after=1):
+        self.max_in_flight = max_in_flight
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            if self.in_flight >= self.max_in_flight:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+
+_shedders = {}
+
+
+def get_load_shedder(scope):
+    config = getattr(settings, "LOAD_SHEDDING", {}).get(scope)
+    if config is None:
+        return None
+    key = (scope, config["MAX_IN_FLIGHT"], config.get("RETRY_AFTER", 1))
+    if key not in _shedders:
+        _shedders[key] = LoadShedder(key[1], key[2])
+    return _shedders[key]
+
+
+class LoadSheddingMixin:
+    """
+    Rejects requests with 503 and ``Retry-After`` once the number of requests
+    in flight for the view's ``throttle_scope`` reaches ``MAX_IN_FLIGHT`` in
+    ``settings.LOAD_SHEDDING``.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        # The slot is released in a finally block: DRF skips
+        # finalize_response() when a non-API exception escapes the view.
+        shedder = get_load_shedder(getattr(self, "throttle_scope", None))
+        acquired = shedder is not None and shedder.acquire()
+        self.overloaded_shedder = shedder if shedder and not acquired else None
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if acquired:
+                shedder.release()
+
+    def initial(self, request, *args, **kwargs):
+        # Raised here rather than in dispatch() so it becomes a regular 503.
+        shedder = getattr(self, "overloaded_shedder", None)
+        if shedder is not None:
+            raise ServiceOverloaded(wait=shedder.retry_after)
+        super().initial(request, *args, **kwargs)
@@ -0,0 +1,347 @@
+import json
+import logging
+import queue
+import random
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack, contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_trace = ContextVar("trace", default=None)
+_current_span = ContextVar("current_span", default=None)
+_noop = nullcontext()
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "start_ns",
+        "end_ns",
+        "attributes",
+        "error",
+    )
+
+    def __init__(self, name, trace_id, parent_id, attributes):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def as_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    def __init__(self, trace_id, parent_id):
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.spans = []
+
+
+def parse_traceparent(header):
+    """Returns ``(trace_id, parent_id, sampled)`` from a W3C traceparent header, or None."""
+    parts = (header or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        flags = int(parts[3], 16)
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return parts[1], parts[2], bool(flags & 1)
+
+
+@contextmanager
+def start_trace(name, traceparent=None, **attributes):
+    """
+    Opens the root span of a trace, continuing ``traceparent`` when given.
+    The caller's sampled flag is only followed with
+    ``TRACING["TRUST_INBOUND_SAMPLING"]``; otherwise any client could force
+    every request to be traced, so ``SAMPLE_RATE`` decides. Unsampled traces
+    record nothing; all spans of a sampled trace are exported together when
+    the root span ends.
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None:
+        trace_id, parent_id, sampled = parent
+    else:
+        trace_id, parent_id, sampled = secrets.token_hex(16), None, None
+    if sampled is None or not settings.TRACING["TRUST_INBOUND_SAMPLING"]:
+        sampled = random.random() < settings.TRACING["SAMPLE_RATE"]
+    if not sampled:
+        yield None
+        return
+
+    trace = Trace(trace_id, parent_id)
+    token = _trace.set(trace)
+    try:
+        with ExitStack() as stack:
+            # Every alias, so queries on wallet shards are timed too.
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(_time_query))
+            yield stack.enter_context(span(name, **attributes))
+    finally:
+        _trace.reset(token)
+        try:
+            get_sink().export(trace.spans)
+        except Exception:
+            logger.exception("Failed to export trace %s", trace_id)
+
+
+def span(name, **attributes):
+    """Times a phase of the current trace; a no-op when the request is not traced."""
+    if _trace.get() is None:
+        return _noop
+    return _span(name, attributes)
+
+
+@contextmanager
+def _span(name, attributes):
+    trace = _trace.get()
+    parent = _current_span.get()
+    current = Span(
+        name,
+        trace.trace_id,
+        parent.span_id if parent is not None else trace.parent_id,
+        attributes,
+    )
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.end_ns = time.time_ns()
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current = _current_span.get()
+        if current is not None:
+            attributes = current.attributes
+            attributes["db.queries"] = attributes.get("db.queries", 0) + 1
+            attributes["db.time_ms"] = round(
+                attributes.get("db.time_ms", 0)
+                + (time.perf_counter() - started) * 1000,
+                3,
+            )
+
+
+def to_otlp(spans):
+    """Spans as an OTLP/JSON ``ExportTraceServiceRequest``."""
+
+    def value(item):
+        if isinstance(item, bool):
+            return {"boolValue": item}
+        if isinstance(item, int):
+            return {"intValue": str(item)}
+        if isinstance(item, float):
+            return {"doubleValue": item}
+        return {"stringValue": str(item)}
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {
+                            "key": "service.name",
+                            "value": value(settings.TRACING["SERVICE_NAME"]),
+                        }
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": __name__},
+                        "spans": [
+                            {
+                                "traceId": s.trace_id,
+                                "spanId": s.span_id,
+                                "parentSpanId": s.parent_id or "",
+                                "name": s.name,
+                                "kind": 1,
+                                "startTimeUnixNano": str(s.start_ns),
+                                "endTimeUnixNano": str(s.end_ns),
+                                "attributes": [
+                                    {"key": key, "value": value(item)}
+                                    for key, item in s.attributes.items()
+                                ],
+                                "status": (
+                                    {"code": 2, "message": s.error}
+                                    if s.error
+                                    else {"code": 1}
+                                ),
+                            }
+                            for s in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class InMemorySink:
+    def __init__(self):
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def export(self, spans):
+        with self.lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self.lock:
+            self.spans.clear()
+
+
+class QueueSink:
+    """
+    Exports traces from a background thread. Traces are dropped when the
+    queue is full so requests never wait on the destination; subclasses
+    implement ``send()`` for a batch of spans.
+    """
+
+    def __init__(self, max_queue=1000):
+        self.queue = queue.Queue(max_queue)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def export(self, spans):
+        try:
+            self.queue.put_nowait(spans)
+        except queue.Full:
+            logger.warning("Trace queue full, dropping %d spans", len(spans))
+
+    def run(self):
+        while True:
+            spans, taken = self.queue.get(), 1
+            while len(spans) < 500:
+                try:
+                    spans = spans + self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                taken += 1
+            try:
+                self.send(spans)
+            except Exception:
+                logger.exception("Failed to send %d spans", len(spans))
+            for _ in range(taken):
+                self.queue.task_done()
+
+    def send(self, spans):
+        raise NotImplementedError
+
+
+class FileSink(QueueSink):
+    """
+    Appends one OTLP/JSON document per batch of traces to
+    ``TRACING["FILE"]``, the format read by the OpenTelemetry collector's
+    otlpjsonfile receiver.
+    """
+
+    def __init__(self, max_queue=1000):
+        self.path = settings.TRACING["FILE"]
+        super().__init__(max_queue)
+
+    def send(self, spans):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(to_otlp(spans), separators=(",", ":")) + "\n")
+
+
+class OTLPHTTPSink(QueueSink):
+    """
+    Sends traces to ``TRACING["OTLP_ENDPOINT"]`` (e.g.
+    ``http://collector:4318/v1/traces``).
+    """
+
+    def __init__(self, max_queue=1000):
+        self.endpoint = settings.TRACING["OTLP_ENDPOINT"]
+        super().__init__(max_queue)
+
+    def send(self, spans):
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(to_otlp(spans)).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+_sinks = {}
+
+
+def get_sink():
+    path = settings.TRACING["SINK"]
+    if path not in _sinks:
+        _sinks[path] = import_string(path)()
+    return _sinks[path]
+
+
+class TracingMiddleware:
+    """
+    Traces sampled requests, continuing the caller's W3C ``traceparent``.
+    The trace id is returned in ``X-Trace-Id``. Async requests pass through.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+        with start_trace(
+            f"{request.method} {request.path}",
+            request.META.get("HTTP_TRACEPARENT"),
+            **{"http.method": request.method, "http.target": request.path},
+        ) as root:
+            response = self.get_response(request)
+            if root is not None:
+                root.attributes["http.status_code"] = response.status_code
+                if request.resolver_match is not None:
+                    root.attributes["http.route"] = request.resolver_match.route
+                response["X-Trace-Id"] = root.trace_id
+        return response
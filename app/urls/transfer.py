@@ -1,8 +1,23 @@
 from django.urls import path
 
-from app.views import TransactionListView, TransferCreateView
+from app.views import (
+    ScheduledTransferDetailView,
+    ScheduledTransferListCreateView,
+    TransactionListView,
+    TransferCreateView,
+)
 
 urlpatterns = [
     path("", TransferCreateView.as_view(), name="transfer-create"),
     path("history/", TransactionListView.as_view(), name="transaction-list"),
+    path(
+        "scheduled/",
+        ScheduledTransferListCreateView.as_view(),
+        name="scheduled-transfer-list",
+    ),
+    path(
+        "scheduled/<int:pk>/",
+        ScheduledTransferDetailView.as_view(),
+        name="scheduled-transfer-detail",
+    ),
 ]
@@ -1,8 +1,19 @@
 from django.urls import path
 
-from app.views import DepositView, WalletDetailView
+from app.views import (
+    DepositView,
+    HoldCaptureView,
+    HoldListCreateView,
+    HoldVoidView,
+    WalletDetailView,
+    wallet_events,
+)
 
 urlpatterns = [
     path("", WalletDetailView.as_view(), name="wallet-detail"),
     path("deposit/", DepositView.as_view(), name="wallet-deposit"),
+    path("events/", wallet_events, name="wallet-events"),
+    path("holds/", HoldListCreateView.as_view(), name="hold-list"),
+    path("holds/<int:pk>/capture/", HoldCaptureView.as_view(), name="hold-capture"),
+    path("holds/<int:pk>/void/", HoldVoidView.as_view(), name="hold-void"),
 ]
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from app.views import WebhookSubscriptionDetailView, WebhookSubscriptionListCreateView
+
+urlpatterns = [
+    path("", WebhookSubscriptionListCreateView.as_view(), name="webhook-list"),
+    path("<int:pk>/", WebhookSubscriptionDetailView.as_view(), name="webhook-detail"),
+]
@@ -1,19 +1,55 @@
-from datetime import datetime
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.dateparse import parse_datetime
+from django.utils.http import parse_etags, quote_etag, urlencode
+from django.utils.timezone import make_aware
 from rest_framework import generics, permissions, serializers, status
 from rest_framework.response import Response
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from .models import User, Wallet
+from .events import get_broker
+from .models import (
+    Hold,
+    ScheduledTransfer,
+    Transaction,
+    User,
+    Wallet,
+    WebhookSubscription,
+)
+from .pagination import TransactionSearchPagination
 from .serializers import (
     CustomTokenObtainPairSerializer,
     DepositSerializer,
+    HoldCaptureSerializer,
+    HoldSerializer,
+    ScheduledTransferSerializer,
     TransactionSerializer,
     TransferSerializer,
     UserSerializer,
     WalletSerializer,
+    WebhookSubscriptionSerializer,
+    transaction_rows,
+    wallet_rows,
+)
+from .throttling import (
+    IPTokenBucketThrottle,
+    LoadSheddingMixin,
+    UserTokenBucketThrottle,
 )
+from .sharding import shard_for_user, shard_for_wallet
+from .tracing import span
 
 
 class UserCreateView(generics.CreateAPIView):
@@ -22,27 +58,39 @@ class UserCreateView(generics.CreateAPIView):
     permission_classes = [permissions.AllowAny]
 
 
-class CustomTokenObtainPairView(TokenObtainPairView):
+class CustomTokenObtainPairView(LoadSheddingMixin, TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+    throttle_classes = [IPTokenBucketThrottle]
+    throttle_scope = "login"
 
 
 class WalletDetailView(generics.RetrieveAPIView):
     serializer_class = WalletSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_object(self):
-        return get_object_or_404(Wallet, user=self.request.user)
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return Wallet.objects.none()
+        return Wallet.objects.for_user(self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        row = get_object_or_404(self.get_queryset().values(*wallet_rows.fields))
+        return Response(wallet_rows.serialize(row))
 
 
-class DepositView(generics.GenericAPIView):
+class DepositView(LoadSheddingMixin, generics.GenericAPIView):
     serializer_class = DepositSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = "deposit"
 
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        with span("deposit.validate"):
+            serializer.is_valid(raise_exception=True)
 
-        wallet = get_object_or_404(Wallet, user=request.user)
+        with span("wallet.lookup"):
+            wallet = get_object_or_404(Wallet.objects.for_user(request.user))
         amount = serializer.validated_data["amount"]
 
         try:
@@ -55,41 +103,337 @@ class DepositView(generics.GenericAPIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TransferCreateView(generics.CreateAPIView):
+class HoldListCreateView(generics.ListCreateAPIView):
+    serializer_class = HoldSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return Hold.objects.none()
+        return (
+            Hold.objects.using(shard_for_user(self.request.user.pk))
+            .filter(wallet__user=self.request.user)
+            .order_by("-created_at")
+        )
+
+    def perform_create(self, serializer):
+        wallet = get_object_or_404(Wallet.objects.for_user(self.request.user))
+        try:
+            serializer.instance = Hold.authorize(wallet, **serializer.validated_data)
+        except ValueError as e:
+            raise serializers.ValidationError({"error": str(e)})
+
+
+class HoldCaptureView(generics.GenericAPIView):
+    serializer_class = HoldCaptureSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return Hold.objects.none()
+        return Hold.objects.using(shard_for_user(self.request.user.pk)).filter(
+            wallet__user=self.request.user
+        )
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        hold = self.get_object()
+        try:
+            hold.capture(serializer.validated_data.get("amount"))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(HoldSerializer(hold).data)
+
+
+class HoldVoidView(HoldCaptureView):
+    serializer_class = HoldSerializer
+
+    def post(self, request, *args, **kwargs):
+        hold = self.get_object()
+        try:
+            hold.void()
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(HoldSerializer(hold).data)
+
+
+class TransferCreateView(LoadSheddingMixin, generics.CreateAPIView):
     serializer_class = TransferSerializer
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [UserTokenBucketThrottle, IPTokenBucketThrottle]
+    throttle_scope = "transfer"
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        with span("transfer.validate"):
+            serializer.is_valid(raise_exception=True)
+        with span("transfer.perform_create"):
+            self.perform_create(serializer)
+        with span("transfer.serialize"):
+            data = serializer.data
+        return Response(
+            data,
+            status=status.HTTP_201_CREATED,
+            headers=self.get_success_headers(data),
+        )
 
     def perform_create(self, serializer):
-        sender_wallet = get_object_or_404(Wallet, user=self.request.user)
+        with span("wallet.lookup"):
+            sender_wallet = get_object_or_404(
+                Wallet.objects.for_user(self.request.user).select_related("user")
+            )
         try:
             serializer.save(sender=sender_wallet)
         except ValueError as e:
             raise serializers.ValidationError({"error": str(e)})
 
 
+def scheduled_transfers_for(user):
+    return ScheduledTransfer.objects.using(shard_for_user(user.pk)).filter(
+        sender__user=user
+    )
+
+
+def attach_receivers(scheduled_transfers):
+    """
+    Loads the receiving wallets, with their users, from whichever shard
+    holds them; a join would drop receivers on another shard.
+    """
+    ids_by_shard = {}
+    for scheduled in scheduled_transfers:
+        ids_by_shard.setdefault(shard_for_wallet(scheduled.receiver_id), set()).add(
+            scheduled.receiver_id
+        )
+    wallets = {}
+    for shard, ids in ids_by_shard.items():
+        wallets.update(
+            Wallet.objects.using(shard).select_related("user").in_bulk(list(ids))
+        )
+    for scheduled in scheduled_transfers:
+        scheduled.receiver = wallets[scheduled.receiver_id]
+    return scheduled_transfers
+
+
+class ScheduledTransferListCreateView(generics.ListCreateAPIView):
+    serializer_class = ScheduledTransferSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return ScheduledTransfer.objects.none()
+        return scheduled_transfers_for(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        scheduled = attach_receivers(list(self.get_queryset()))
+        return Response(self.get_serializer(scheduled, many=True).data)
+
+    def perform_create(self, serializer):
+        sender_wallet = get_object_or_404(Wallet.objects.for_user(self.request.user))
+        if serializer.validated_data["receiver"] == sender_wallet:
+            raise serializers.ValidationError({"error": "Cannot transfer to yourself"})
+        serializer.save(sender=sender_wallet)
+
+
+class ScheduledTransferDetailView(generics.RetrieveDestroyAPIView):
+    serializer_class = ScheduledTransferSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return ScheduledTransfer.objects.none()
+        return scheduled_transfers_for(self.request.user)
+
+    def get_object(self):
+        return attach_receivers([super().get_object()])[0]
+
+
+class WebhookSubscriptionListCreateView(generics.ListCreateAPIView):
+    serializer_class = WebhookSubscriptionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return WebhookSubscription.objects.none()
+        return WebhookSubscription.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+
+class WebhookSubscriptionDetailView(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = WebhookSubscriptionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        if getattr(self, "swagger_fake_view", False):
+            return WebhookSubscription.objects.none()
+        return WebhookSubscription.objects.filter(user=self.request.user)
+
+
 class TransactionListView(generics.ListAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    @property
+    def paginator(self):
+        # Only search results are paginated; the plain history stays a list.
+        if not hasattr(self, "_paginator"):
+            self._paginator = (
+                TransactionSearchPagination()
+                if self.request.query_params.get("q")
+                else None
+            )
+        return self._paginator
+
+    def get_wallet(self):
+        if not hasattr(self, "_wallet"):
+            self._wallet = get_object_or_404(
+                Wallet.objects.for_user(self.request.user).values("id")
+            )
+        return self._wallet
+
+    def get_etag(self):
+        """
+        Strong ETag for the response: rows render only from their own columns
+        (the counterparty e-mail is stored when they are written) and the
+        transfer memo, neither of which is edited afterwards. The wallet's
+        latest ledger id and row count, read from the (wallet, id) index
+        alone, plus the query string identify it.
+        """
+        wallet = self.get_wallet()
+        ledger = Transaction.objects.for_wallet(wallet["id"]).aggregate(
+            latest=Max("id"), count=Count("id")
+        )
+        params = urlencode(sorted(self.request.query_params.lists()), doseq=True)
+        digest = hashlib.sha256(params.encode()).hexdigest()[:16]
+        return quote_etag(
+            f"{wallet['id']}-{ledger['latest'] or 0}-{ledger['count']}-{digest}"
+        )
+
     def get_queryset(self):
-        wallet = get_object_or_404(Wallet, user=self.request.user)
-        queryset = wallet.transactions.all().order_by("-created_at")
+        wallet = self.get_wallet()
+        queryset = Transaction.objects.for_wallet(wallet["id"]).order_by("-created_at")
+
+        since_id = self.request.query_params.get("since_id")
+        if since_id and since_id.isdigit():
+            # Delta sync: only rows after the client's high-water mark, oldest
+            # first so the last row is the next mark.
+            queryset = queryset.filter(id__gt=int(since_id)).order_by("id")
+
+        since = self.request.query_params.get("since")
+        if since:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is not None:
+                queryset = queryset.filter(created_at__gt=since)
+
+        query = self.request.query_params.get("q", "").strip()
+        if query:
+            queryset = queryset.search(query)
 
         start_date = self.request.query_params.get("start_date")
         end_date = self.request.query_params.get("end_date")
 
+        # Day boundaries become created_at ranges so (wallet, created_at) can
+        # be used; created_at__date would wrap the column in a cast.
         if start_date:
             try:
-                start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-                queryset = queryset.filter(created_at__date__gte=start_date)
+                start_date = datetime.strptime(start_date, "%Y-%m-%d")
+                queryset = queryset.filter(created_at__gte=make_aware(start_date))
             except ValueError:
                 pass
 
         if end_date:
             try:
-                end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
-                queryset = queryset.filter(created_at__date__lte=end_date)
+                end_date = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+                queryset = queryset.filter(created_at__lt=make_aware(end_date))
             except ValueError:
                 pass
 
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag()
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values(*transaction_rows.fields)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            response = self.get_paginated_response(
+                transaction_rows.serialize_many(page)
+            )
+        else:
+            response = Response(transaction_rows.serialize_many(rows))
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+
+def sse_event(event, data, event_id=None):
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    return f"id: {event_id}\n{message}" if event_id is not None else message
+
+
+async def wallet_events(request):
+    """
+    Server-Sent Events stream with the caller's balance followed by every
+    committed transaction on their wallet. Served by the ASGI application.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(
+            {"error": "Event streams are only served by the ASGI application"},
+            status=status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    try:
+        auth = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except (AuthenticationFailed, InvalidToken) as e:
+        return JsonResponse({"detail": str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+    if auth is None:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    wallets = Wallet.objects.for_user(auth[0])
+    wallet_id = await wallets.values_list("id", flat=True).afirst()
+    if wallet_id is None:
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    # Subscribe before reading the snapshot: a transaction committed in
+    # between is then both in the balance and in the stream, never in neither.
+    subscription = get_broker().subscribe(wallet_id)
+    try:
+        balance = (
+            await wallets.filter(pk=wallet_id).values_list("balance", flat=True).aget()
+        )
+    except BaseException:
+        subscription.close()
+        raise
+    heartbeat = settings.WALLET_EVENTS["HEARTBEAT"]
+
+    async def stream():
+        try:
+            yield sse_event(
+                "balance", {"wallet_id": wallet_id, "balance": f"{balance:f}"}
+            )
+            while True:
+                try:
+                    event = await subscription.get(timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse_event(event["event"], event, event["transaction"]["id"])
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,141 @@
+import hashlib
+import hmac
+import http.client
+import ipaddress
+import json
+import random
+import socket
+import time
+import urllib.error
+import urllib.request
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+
+def sign(secret, timestamp, body):
+    """
+    Signature sent in ``X-Webhook-Signature``. Receivers recompute it over
+    ``"<X-Webhook-Timestamp>.<raw body>"`` and compare in constant time.
+    """
+    message = f"{timestamp}.".encode() + body
+    return "sha256=" + hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+
+class BlockedAddressError(OSError):
+    """A webhook host resolved to a private, loopback or otherwise non-public address."""
+
+
+def is_public_address(address):
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_url(url):
+    """
+    Raises BlockedAddressError unless every address the URL's host resolves
+    to is public, so subscriptions cannot point the worker at internal
+    services. Skipped when ``WEBHOOKS["ALLOW_PRIVATE_NETWORKS"]`` is set.
+    """
+    if settings.WEBHOOKS["ALLOW_PRIVATE_NETWORKS"]:
+        return
+    parts = urlsplit(url)
+    try:
+        addresses = socket.getaddrinfo(
+            parts.hostname, parts.port or 443, type=socket.SOCK_STREAM
+        )
+    except (socket.gaierror, UnicodeError):
+        raise BlockedAddressError(f"Cannot resolve {parts.hostname}")
+    for *_, sockaddr in addresses:
+        if not is_public_address(sockaddr[0]):
+            raise BlockedAddressError(
+                f"{parts.hostname} resolves to a non-public address"
+            )
+
+
+class PublicOnlyConnectionMixin:
+    # Checks the address actually connected to, so a DNS answer that changed
+    # since the subscription was validated cannot reach internal hosts.
+    def connect(self):
+        super().connect()
+        if not is_public_address(self.sock.getpeername()[0]):
+            self.close()
+            raise BlockedAddressError(f"{self.host} resolves to a non-public address")
+
+
+class PublicHTTPConnection(PublicOnlyConnectionMixin, http.client.HTTPConnection):
+    pass
+
+
+class PublicHTTPSConnection(PublicOnlyConnectionMixin, http.client.HTTPSConnection):
+    pass
+
+
+class PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(PublicHTTPConnection, req)
+
+
+class PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(PublicHTTPSConnection, req, context=self._context)
+
+
+class NoRedirectHandler(urllib.request.HTTPRedirectHandler):
+    # A 3xx is reported as a failed delivery instead of being followed to a
+    # location that was never validated.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def build_opener():
+    handlers = [NoRedirectHandler()]
+    if not settings.WEBHOOKS["ALLOW_PRIVATE_NETWORKS"]:
+        # Environment proxies are bypassed: behind one, the peer address
+        # would be the proxy's.
+        handlers += [
+            urllib.request.ProxyHandler({}),
+            PublicHTTPHandler(),
+            PublicHTTPSHandler(),
+        ]
+    return urllib.request.build_opener(*handlers)
+
+
+def deliver(delivery, timeout):
+    """
+    POSTs a delivery to its subscription URL. Returns ``(status_code, error)``;
+    ``error`` is empty for 2xx responses. Redirects are not followed and
+    non-public addresses are refused (see build_opener).
+    """
+    body = json.dumps(delivery.payload, separators=(",", ":")).encode()
+    timestamp = str(int(time.time()))
+    request = urllib.request.Request(
+        delivery.subscription.url,
+        data=body,
+        method="POST",
+        headers={
+            "Content-Type": "application/json",
+            "User-Agent": "digital-wallet-webhooks/1.0",
+            "X-Webhook-Id": str(delivery.pk),
+            "X-Webhook-Event": delivery.event,
+            "X-Webhook-Timestamp": timestamp,
+            "X-Webhook-Signature": sign(delivery.subscription.secret, timestamp, body),
+        },
+    )
+    try:
+        with build_opener().open(request, timeout=timeout) as response:
+            return response.status, ""
+    except urllib.error.HTTPError as e:
+        return e.code, f"HTTP {e.code}"
+    except (urllib.error.URLError, OSError) as e:
+        return None, str(getattr(e, "reason", e))
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter, capped at ``WEBHOOKS["BACKOFF_MAX"]``."""
+    config = settings.WEBHOOKS
+    delay = min(config["BACKOFF_BASE"] * 2 ** (attempts - 1), config["BACKOFF_MAX"])
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
@@ -29,6 +29,20 @@ DEBUG = os.getenv("DEBUG", "True") == "True"
 
 ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1").split(",")
 
+# API-only nodes skip the admin, the Swagger/Redoc docs and the session and
+# message machinery, which keeps worker boot time down.
+API_ONLY = os.getenv("API_ONLY", "False") == "True"
+
+FULL_STACK_ONLY = [
+    "django.contrib.admin",
+    "django.contrib.sessions",
+    "django.contrib.messages",
+    "drf_yasg",
+    "django.contrib.sessions.middleware.SessionMiddleware",
+    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "django.contrib.messages.middleware.MessageMiddleware",
+]
+
 
 # Application definition
 
@@ -48,6 +62,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "app.profiling.ProfilingMiddleware",
+    "app.tracing.TracingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -57,6 +73,10 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+if API_ONLY:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in FULL_STACK_ONLY]
+    MIDDLEWARE = [item for item in MIDDLEWARE if item not in FULL_STACK_ONLY]
+
 ROOT_URLCONF = "digital_wallet_api.urls"
 
 TEMPLATES = [
@@ -74,6 +94,11 @@ TEMPLATES = [
     },
 ]
 
+if API_ONLY:
+    TEMPLATES[0]["OPTIONS"]["context_processors"].remove(
+        "django.contrib.messages.context_processors.messages"
+    )
+
 WSGI_APPLICATION = "digital_wallet_api.wsgi.application"
 
 
@@ -91,6 +116,23 @@ DATABASES = {
     }
 }
 
+# Wallets, ledger rows and transfers are spread over these database aliases by
+# user id (see app/sharding.py). Extra aliases reuse the default connection
+# settings with their own DB_NAME_<ALIAS> and DB_HOST_<ALIAS>.
+WALLET_SHARDS = os.getenv("WALLET_SHARDS", "default").split(",")
+
+for alias in WALLET_SHARDS:
+    if alias not in DATABASES:
+        DATABASES[alias] = {
+            **DATABASES["default"],
+            "NAME": os.getenv(
+                f"DB_NAME_{alias.upper()}", f"{DATABASES['default']['NAME']}_{alias}"
+            ),
+            "HOST": os.getenv(f"DB_HOST_{alias.upper()}", DATABASES["default"]["HOST"]),
+        }
+
+DATABASE_ROUTERS = ["app.sharding.ShardRouter"]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -140,6 +182,109 @@ REST_FRAMEWORK = {
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
+    # orjson-backed JSON; the browsable API is only rendered in development.
+    "DEFAULT_RENDERER_CLASSES": ["app.renderers.ORJSONRenderer"]
+    + (["rest_framework.renderers.BrowsableAPIRenderer"] if DEBUG else []),
+    "DEFAULT_PARSER_CLASSES": [
+        "app.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+    # Token-bucket rates per throttle_scope ("<scope>" per user, "<scope>_ip" per IP).
+    "DEFAULT_THROTTLE_RATES": {
+        "login_ip": os.getenv("THROTTLE_LOGIN_IP", "100/min"),
+        "deposit": os.getenv("THROTTLE_DEPOSIT", "60/min"),
+        "deposit_ip": os.getenv("THROTTLE_DEPOSIT_IP", "300/min"),
+        "transfer": os.getenv("THROTTLE_TRANSFER", "60/min"),
+        "transfer_ip": os.getenv("THROTTLE_TRANSFER_IP", "300/min"),
+    },
+}
+
+# "app.throttling.CacheBucketStore" shares the buckets between workers.
+THROTTLE_BUCKET_STORE = os.getenv(
+    "THROTTLE_BUCKET_STORE", "app.throttling.LocalMemoryBucketStore"
+)
+
+# Maximum concurrent requests per worker for each throttle_scope before
+# answering 503 with Retry-After.
+LOAD_SHEDDING = {
+    "login": {
+        "MAX_IN_FLIGHT": int(os.getenv("MAX_IN_FLIGHT_LOGIN", "8")),
+        "RETRY_AFTER": 1,
+    },
+    "deposit": {
+        "MAX_IN_FLIGHT": int(os.getenv("MAX_IN_FLIGHT_DEPOSIT", "16")),
+        "RETRY_AFTER": 1,
+    },
+    "transfer": {
+        "MAX_IN_FLIGHT": int(os.getenv("MAX_IN_FLIGHT_TRANSFER", "16")),
+        "RETRY_AFTER": 1,
+    },
+}
+
+# Delivery policy for the dispatch_webhooks worker (times in seconds).
+WEBHOOKS = {
+    "TIMEOUT": float(os.getenv("WEBHOOK_TIMEOUT", "5")),
+    "MAX_ATTEMPTS": int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "10")),
+    "BACKOFF_BASE": 10,
+    "BACKOFF_MAX": 3600,
+    # Failures in a row before an endpoint is skipped for CIRCUIT_COOLDOWN.
+    "CIRCUIT_THRESHOLD": 5,
+    "CIRCUIT_COOLDOWN": 300,
+    # Minimum time a claimed delivery is hidden from other workers; the
+    # dispatcher extends it to cover a whole batch at its concurrency.
+    "LEASE": 60,
+    # Allow webhook URLs on private, loopback and link-local addresses
+    # (local development only).
+    "ALLOW_PRIVATE_NETWORKS": os.getenv("WEBHOOK_ALLOW_PRIVATE_NETWORKS", "False")
+    == "True",
+}
+
+# On-demand profiling of single requests by staff users (see app.profiling).
+PROFILING = {
+    "ENABLED": os.getenv("PROFILING_ENABLED", "True") == "True",
+    "HEADER": "X-Profile",
+    "QUERY_PARAM": "_profile",
+    "STORE_DIR": os.getenv("PROFILING_STORE_DIR", ""),
+    # Functions listed in the JSON report, by cumulative time.
+    "TOP": 50,
+}
+
+# Phase-level spans for sampled requests (see app.tracing). Requests with a
+# sampled W3C traceparent header are always traced.
+TRACING = {
+    "SINK": os.getenv("TRACING_SINK", "app.tracing.FileSink"),
+    "SAMPLE_RATE": float(os.getenv("TRACING_SAMPLE_RATE", "0.0")),
+    # Follow the sampled flag of incoming traceparent headers; only enable
+    # behind a gateway that sets or strips the header for outside callers.
+    "TRUST_INBOUND_SAMPLING": os.getenv("TRACING_TRUST_INBOUND_SAMPLING", "False")
+    == "True",
+    "SERVICE_NAME": "digital-wallet-api",
+    "FILE": os.getenv("TRACING_FILE", str(BASE_DIR / "traces.jsonl")),
+    "OTLP_ENDPOINT": os.getenv("OTLP_ENDPOINT", "http://localhost:4318/v1/traces"),
+}
+
+# Users without a limit tier get the tier with this name; empty means no limits.
+VELOCITY_LIMITS = {
+    "DEFAULT_TIER": os.getenv("DEFAULT_LIMIT_TIER", ""),
+}
+
+# Email/CPF -> wallet lookups for transfers (app/aliases.py), per process.
+WALLET_ALIAS_CACHE = {
+    "MAX_SIZE": int(os.getenv("WALLET_ALIAS_CACHE_SIZE", "10000")),
+    "TTL": int(os.getenv("WALLET_ALIAS_CACHE_TTL", "60")),
+}
+
+HOLDS = {
+    # Seconds an authorization stays open unless the caller sets expires_at.
+    "DEFAULT_TTL": int(os.getenv("HOLD_TTL", str(7 * 24 * 3600))),
+}
+
+# Fan-out for /api/wallet/events/. InMemoryBroker only reaches subscribers in
+# the publishing process; PostgresNotifyBroker works across workers.
+WALLET_EVENTS = {
+    "BROKER": os.getenv("WALLET_EVENTS_BROKER", "app.events.InMemoryBroker"),
+    "HEARTBEAT": 15,
 }
 
 SIMPLE_JWT = {
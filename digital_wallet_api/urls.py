@@ -15,34 +15,56 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
-from django.contrib import admin
+from functools import cache
+
+from django.conf import settings
 from django.urls import include, path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Digital Wallet API",
-        default_version="v1",
-        description="API for managing digital wallets and financial transactions",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="brunodealmeida17@hotmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=[permissions.AllowAny],
-)
+
+@cache
+def get_docs_view(renderer):
+    # drf_yasg and the schema are only loaded when the docs are first requested.
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    schema_view = get_schema_view(
+        openapi.Info(
+            title="Digital Wallet API",
+            default_version="v1",
+            description="API for managing digital wallets and financial transactions",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="brunodealmeida17@hotmail.com"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=[permissions.AllowAny],
+    )
+    return schema_view.with_ui(renderer, cache_timeout=0)
+
+
+def swagger_view(request, *args, **kwargs):
+    return get_docs_view("swagger")(request, *args, **kwargs)
+
+
+def redoc_view(request, *args, **kwargs):
+    return get_docs_view("redoc")(request, *args, **kwargs)
+
 
 urlpatterns = [
-    path("admin/", admin.site.urls),
     path("api/auth/", include("app.urls.auth")),
     path("api/wallet/", include("app.urls.wallet")),
     path("api/transfer/", include("app.urls.transfer")),
-    path(
-        "swagger/",
-        schema_view.with_ui("swagger", cache_timeout=0),
-        name="schema-swagger-ui",
-    ),
-    path("redoc/", schema_view.with_ui("redoc", cache_timeout=0), name="schema-redoc"),
+    path("api/webhooks/", include("app.urls.webhook")),
 ]
+
+if "django.contrib.admin" in settings.INSTALLED_APPS:
+    from django.contrib import admin
+
+    urlpatterns.insert(0, path("admin/", admin.site.urls))
+
+if "drf_yasg" in settings.INSTALLED_APPS:
+    urlpatterns += [
+        path("swagger/", swagger_view, name="schema-swagger-ui"),
+        path("redoc/", redoc_view, name="schema-redoc"),
+    ]